@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+"""
+Usage: make-limb-repo [options] <directory>
+	--limbs <n>		Number of limbs (default 2)
+	--branches <n>		Number of dev branches in each limb (default 4)
+	--changes <n>		Changes added to each dev branch (default 20)
+	--stable <n>		Commits on each external stable branch (default 10)
+	--msd <n>		Number of msd branches in each limb (default 2)
+	--bugfixes <n>		Bugfixes sublimbs in each limb (default 1)
+	--files <n>		Number of source files (default 50)
+
+Creates a synthetic MVL6 kernel repository for benchmarking, with the
+layout of a production limb repository:
+
+    <directory>/server.git	a bare repository with the hook installed
+    <directory>/clone		a clone of it, with local limb changes
+    <directory>/bench-params	the options used, one per line
+
+Each limb, named mvl-bench-<n>, has a limb-info branch holding
+MONTAVISTA/upstream_version and MONTAVISTA/branch_dependencies, a
+common branch, an external stable branch, dev branches holding the
+stable commits and changes carrying ChangeIDs, each dev branch also
+carrying half of the changes of the one before it, and msd branches
+changing their defconfigs.  Bugfixes sublimbs add fixes to a dev
+branch.
+
+The pushed state of each limb is under refs/heads in server.git.  The
+next state, with new changes on each dev branch and one msd branch
+rebased, is under refs/bench/next in server.git, and is the state of
+the local branches in the clone.
+
+The repository is generated with a single "git fast-import", and is
+the same for the same options.
+"""
+
+import sys
+import os
+import getopt
+import shutil
+import subprocess
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+
+config = {
+    "limbs"		: 2,
+    "branches"		: 4,
+    "changes"		: 20,
+    "stable"		: 10,
+    "msd"		: 2,
+    "bugfixes"		: 1,
+    "files"		: 50,
+}
+
+upstream_version = '2.6.32'
+author = 'Bench User <bench@example.com>'
+base_time = 1300000000
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def process_options():
+    short_opts = "h"
+    long_opts = ["help", "limbs=", "branches=", "changes=", "stable=",
+		 "msd=", "bugfixes=", "files="]
+
+    try:
+	options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+
+    except getopt.GetoptError, err:
+	usage(err)
+
+    for option, value in options:
+	if option == "--help" or option == "-h":
+	    usage()
+	else:
+	    try:
+		config[option[2:]] = int(value)
+	    except ValueError:
+		usage('%s requires a number' % option)
+
+    if len(args) != 1:
+	usage()
+
+    config["directory"] = os.path.abspath(args[0])
+
+
+def run(cmd, cwd=None, input=None):
+    p = subprocess.Popen(cmd, cwd=cwd, stdin=subprocess.PIPE)
+    p.communicate(input)
+    if p.wait() != 0:
+	sys.stderr.write('failed: %s\n' % ' '.join(cmd))
+	sys.exit(1)
+
+
+def changeid(name):
+    return sha1(name).hexdigest()
+
+
+class Stream(object):
+    '''
+    Writes a "git fast-import" stream
+
+    Each branch state is a dictionary of file contents, so that
+    commits can be written with the complete contents of the files
+    they change.
+    '''
+
+    def __init__(self, file):
+	self.file = file
+	self.mark = 0
+	self.time = base_time
+
+
+    def commit(self, ref, parent, files, changed, message):
+	'''
+	Write a commit of the changed paths of files onto parent,
+	returning its mark
+	'''
+	self.mark += 1
+	self.time += 60
+	write = self.file.write
+	write('commit %s\n' % ref)
+	write('mark :%d\n' % self.mark)
+	write('author %s %d +0000\n' % (author, self.time))
+	write('committer %s %d +0000\n' % (author, self.time))
+	write('data %d\n%s\n' % (len(message), message))
+	if parent:
+	    write('from :%d\n' % parent)
+	if parent is None:
+	    write('deleteall\n')
+	for path in changed:
+	    write('M 100644 inline %s\n' % path)
+	    write('data %d\n%s\n' % (len(files[path]), files[path]))
+	return self.mark
+
+
+    def tag(self, name, mark, message):
+	write = self.file.write
+	write('tag %s\n' % name)
+	write('from :%d\n' % mark)
+	write('tagger %s %d +0000\n' % (author, self.time))
+	write('data %d\n%s\n' % (len(message), message))
+
+
+    def reset(self, ref, mark):
+	self.file.write('reset %s\nfrom :%d\n\n' % (ref, mark))
+
+
+def mv_message(subject, name, bugz):
+    return ('%s\n\n'
+	    'MG-Jira: %d\n'
+	    'Source: MontaVista Software, LLC\n'
+	    'Type: Enhancement\n'
+	    'Disposition: Local\n'
+	    'ChangeID: %s\n'
+	    'Signed-off-by: %s\n' % (subject, bugz, changeid(name), author))
+
+
+class Branch(object):
+    '''
+    The state of a generated branch: its tip mark and file contents
+    '''
+
+    def __init__(self, stream, ref, parent):
+	self.stream = stream
+	self.ref = ref
+	if parent:
+	    self.mark = parent.mark
+	    self.files = parent.files.copy()
+	else:
+	    self.mark = None
+	    self.files = {}
+	self.changes = []
+
+
+    def copy(self, ref):
+	branch = Branch(self.stream, ref, self)
+	branch.changes = list(self.changes)
+	return branch
+
+
+    def apply(self, change, message):
+	'''
+	Commit a change, a (name, path, line) tuple
+	'''
+	name, path, line = change
+	self.files[path] = self.files.get(path, '') + line
+	self.mark = self.stream.commit(self.ref, self.mark, self.files,
+				       [path], message)
+	self.changes.append(change)
+
+
+    def write(self, changed, message, parent=0):
+	if parent == 0:
+	    parent = self.mark
+	self.mark = self.stream.commit(self.ref, parent, self.files,
+				       changed, message)
+
+
+def source_dir(n):
+    return 'drivers/bench/d%03d' % (n % config["files"])
+
+
+def make_change(limb_index, name):
+    '''
+    Return a change adding a file beside one of the source files, so
+    that changes apply in any order
+    '''
+    n = int(changeid(name)[:8], 16)
+    return (name, '%s/%s.c' % (source_dir(n), name),
+	    'int %s;\n' % name.replace('-', '_'))
+
+
+def generate_limb(stream, base, i):
+    limbname = 'mvl-bench-%d' % i
+    bugz = 1000 + i
+    refs = {}
+
+    def ref(subname):
+	return 'refs/heads/%s/%s' % (limbname, subname)
+
+    # external stable branch
+    stable = Branch(stream, ref('external.linux-2.6.32.y'), base)
+    stable_changes = []
+    for k in range(config["stable"]):
+	name = 'stable-%d-%d' % (i, k)
+	change = make_change(i, name)
+	stable.apply(change, 'stable fix %d\n' % k)
+	stable_changes.append(change)
+    refs['external.linux-2.6.32.y'] = stable
+
+    # common branch
+    common = Branch(stream, ref('common'), base)
+    common.files['MONTAVISTA/upstream_version'] = upstream_version + '\n'
+    common.write(['MONTAVISTA/upstream_version'], 'Add upstream_version\n')
+    for k in range(config["changes"] / 2):
+	name = 'common-%d-%d' % (i, k)
+	common.apply(make_change(i, name),
+		     mv_message('common: change %d' % k, name, bugz))
+    refs['common'] = common
+
+    # dev branches, each carrying half of the previous one's changes
+    previous = None
+    for j in range(config["branches"]):
+	dev = common.copy(ref('dev.b%d' % j))
+	for change in stable_changes:
+	    dev.apply(change, 'stable fix %s\n\n(cherry picked from stable)\n'
+		      % change[0])
+	if previous:
+	    own = previous.changes[len(common.changes) + len(stable_changes):]
+	    for change in own[::2]:
+		dev.apply(change, mv_message('dev: %s' % change[0],
+					     change[0], bugz))
+	for k in range(config["changes"]):
+	    name = 'dev-%d-%d-%d' % (i, j, k)
+	    dev.apply(make_change(i, name),
+		      mv_message('dev: change %d' % k, name, bugz))
+	refs['dev.b%d' % j] = dev
+	previous = dev
+
+    # msd branches
+    for k in range(config["msd"]):
+	msd = refs['dev.b0'].copy(ref('msd.m%d' % k))
+	path = 'configs/m%d_defconfig' % k
+	name = 'msd-%d-%d' % (i, k)
+	msd.files[path] += 'CONFIG_BENCH_MSD_%d=y\n' % k
+	msd.write([path], mv_message('msd: defconfig %d' % k, name, bugz))
+	refs['msd.m%d' % k] = msd
+
+    # limb-info
+    lines = ['common:\n']
+    for j in range(config["branches"]):
+	lines.append('dev.b%d:\n\tcommon\n\texternal.linux-2.6.32.y\n' % j)
+	if j:
+	    lines.append('\tdev.b%d\n' % (j - 1))
+    for k in range(config["msd"]):
+	lines.append('msd.m%d:\n\tdev.b0\n' % k)
+    lines.append('external.linux-2.6.32.y: frozen\n')
+    info = Branch(stream, ref('limb-info'), None)
+    info.files['MONTAVISTA/upstream_version'] = upstream_version + '\n'
+    info.files['MONTAVISTA/branch_dependencies'] = ''.join(lines)
+    info.write(info.files.keys(), 'limb-info\n', parent=None)
+    refs['limb-info'] = info
+
+    # bugfixes sublimbs
+    for k in range(config["bugfixes"]):
+	fix_bugz = 20000 + i * 100 + k
+	subname = 'bugfixes/%d_bench/dev.b0' % fix_bugz
+	fix = refs['dev.b0'].copy(ref(subname))
+	for n in range(3):
+	    name = 'fix-%d-%d-%d' % (i, k, n)
+	    fix.apply(make_change(i, name),
+		      mv_message('fix: %d' % n, name, fix_bugz))
+	refs[subname] = fix
+
+    # the next state: new changes on each dev branch, an msd rebased
+    next = {}
+    for subname, branch in refs.items():
+	next[subname] = branch.copy('refs/bench/next/%s/%s' %
+				    (limbname, subname))
+    for j in range(config["branches"]):
+	dev = next['dev.b%d' % j]
+	for k in range(2):
+	    name = 'next-%d-%d-%d' % (i, j, k)
+	    dev.apply(make_change(i, name),
+		      mv_message('dev: next change %d' % k, name, bugz))
+    if config["msd"]:
+	msd = refs['msd.m0']
+	rebased = next['dev.b0'].copy(next['msd.m0'].ref)
+	path = 'configs/m0_defconfig'
+	rebased.files[path] = msd.files[path]
+	rebased.write([path], mv_message('msd: defconfig 0', 'msd-%d-0' % i,
+					 bugz))
+	next['msd.m0'] = rebased
+
+    for branch in next.values():
+	stream.reset(branch.ref, branch.mark)
+
+    return limbname, refs.keys()
+
+
+def generate(file):
+    stream = Stream(file)
+
+    base = Branch(stream, 'refs/heads/master', None)
+    base.files['Makefile'] = 'VERSION = 2\nPATCHLEVEL = 6\nSUBLEVEL = 32\n'
+    base.files['Kconfig'] = 'config BENCH\n\tbool\n'
+    base.files['scripts/kconfig/baseconfig'] = 'CONFIG_BENCH=y\n'
+    for n in range(config["files"]):
+	base.files['%s/base.c' % source_dir(n)] = '/* bench file %d */\n' % n
+    for k in range(max(config["msd"], 1)):
+	base.files['configs/m%d_defconfig' % k] = \
+	    '# checksetconfig\nCONFIG_BENCH=y\n'
+    base.write(base.files.keys(), 'Linux %s\n' % upstream_version, parent=None)
+    stream.tag('v%s' % upstream_version, base.mark,
+	       'Linux %s\n' % upstream_version)
+
+    limbs = []
+    for i in range(config["limbs"]):
+	limbs.append(generate_limb(stream, base, i))
+    file.write('done\n')
+    return limbs
+
+
+def main():
+    process_options()
+
+    directory = config["directory"]
+    server = os.path.join(directory, 'server.git')
+    clone = os.path.join(directory, 'clone')
+    if os.path.exists(directory):
+	shutil.rmtree(directory)
+    os.makedirs(directory)
+
+    run(['git', 'init', '-q', '--bare', server])
+    p = subprocess.Popen(['git', 'fast-import', '--quiet', '--done'],
+			 cwd=server, stdin=subprocess.PIPE)
+    limbs = generate(p.stdin)
+    p.stdin.close()
+    if p.wait() != 0:
+	sys.stderr.write('git fast-import failed\n')
+	sys.exit(1)
+
+    for name, value in (('mvista.repo-type', 'mvl6-kernel'),
+			('mvista.remote-alias', 'origin')):
+	run(['git', 'config', name, value], cwd=server)
+    open(os.path.join(server, 'description'), 'w').write(
+	'Synthetic limb repository\n')
+
+    run(['git', 'clone', '-q', server, clone])
+    for name, value in (('mvista.repo-type', 'mvl6-kernel'),
+			('mvista.remote-alias', 'origin'),
+			('user.name', 'Bench User'),
+			('user.email', 'bench@example.com')):
+	run(['git', 'config', name, value], cwd=clone)
+    run(['git', 'fetch', '-q', 'origin', 'refs/bench/*:refs/bench/*'],
+	cwd=clone)
+
+    # local branches at the next state, tracking the pushed ones
+    lines = []
+    for limbname, subnames in limbs:
+	for subname in subnames:
+	    name = '%s/%s' % (limbname, subname)
+	    lines.append('create refs/heads/%s refs/bench/next/%s\n' %
+			 (name, name))
+    run(['git', 'update-ref', '--stdin'], cwd=clone, input=''.join(lines))
+    run(['git', 'checkout', '-q', '%s/dev.b0' % limbs[0][0]], cwd=clone)
+
+    # the layout, for the benchmark results
+    file = open(os.path.join(directory, 'bench-params'), 'w')
+    names = config.keys()
+    names.sort()
+    for name in names:
+	if name != "directory":
+	    file.write('%s %s\n' % (name, config[name]))
+    file.close()
+
+    sys.stdout.write('%s\n' % directory)
+
+
+main()
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+"""
+Usage: run-bench [-r <n>] [--cold] [-o <file>] [--compare <baseline>]
+		 [--ops <op>[,<op>]...] <directory>
+	-r, --repeat <n>	Time each operation <n> times (default 3)
+	--cold			Remove the persistent caches before each run
+	-o, --output <file>	Write the results to <file> instead of stdout
+	--compare <baseline>	Also report each median relative to the
+				one in <baseline>, a file written by -o
+	--ops <ops>		Run only the named operations
+	--list			List the operations
+
+Times the mvgit commands against a repository made by make-limb-repo
+in <directory>, running the commands of this source tree.  The
+results are written as JSON: the repository's layout, the versions of
+git and python, and for each operation the time of each run, their
+minimum, median and mean, in seconds, and the number of git processes
+the operation ran.
+
+The operations are run in the first limb, mvl-bench-0.  Every run
+starts from the same repository state, except for mvgit's persistent
+caches, which the first run fills unless --cold is given.
+"""
+
+import sys
+import os
+import getopt
+import time
+import pwd
+import shutil
+import tempfile
+import subprocess
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+package_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, package_dir)
+
+import mvgitlib as git
+
+try:
+    import json
+except ImportError:
+    json = None
+
+
+config = {
+    "repeat"		: 3,
+    "output"		: None,
+    "compare"		: None,
+    "ops"		: None,
+    "list"		: False,
+    "cold"		: False,
+}
+
+limbname = 'mvl-bench-0'
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def process_options():
+    short_opts = "hr:o:"
+    long_opts = ["help", "repeat=", "cold", "output=", "compare=", "ops=",
+		 "list"]
+
+    try:
+	options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+
+    except getopt.GetoptError, err:
+	usage(err)
+
+    for option, value in options:
+	if option == "--help" or option == "-h":
+	    usage()
+	elif option == "--repeat" or option == "-r":
+	    try:
+		config["repeat"] = int(value)
+	    except ValueError:
+		usage('--repeat requires a number')
+	elif option == "--output" or option == "-o":
+	    config["output"] = value
+	elif option == "--compare":
+	    if not json:
+		usage('--compare requires python 2.6 or later')
+	    config["compare"] = value
+	elif option == "--ops":
+	    config["ops"] = value.split(',')
+	elif option == "--list":
+	    config["list"] = True
+	elif option == "--cold":
+	    config["cold"] = True
+
+    if config["list"]:
+	return
+
+    if len(args) != 1:
+	usage()
+
+    directory = os.path.abspath(args[0])
+    config["server"] = os.path.join(directory, 'server.git')
+    config["clone"] = os.path.join(directory, 'clone')
+    config["params"] = os.path.join(directory, 'bench-params')
+    if not os.path.isfile(config["params"]):
+	usage('%s was not made by make-limb-repo' % directory)
+
+
+class BenchError(Exception):
+    pass
+
+
+def run(cmd, cwd, input=None, env=None):
+    '''
+    Run cmd, returning its output, and raise BenchError if it fails
+    '''
+    p = subprocess.Popen(cmd, cwd=cwd, env=env, stdin=subprocess.PIPE,
+			 stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    output, errors = p.communicate(input)
+    if p.returncode != 0:
+	raise BenchError('"%s" failed:\n%s%s' % (' '.join(cmd), output, errors))
+    return output
+
+
+def read_params():
+    params = {}
+    for line in open(config["params"]):
+	name, value = line.split()
+	params[name] = int(value)
+    return params
+
+
+def make_bin_dir():
+    '''
+    Return a directory of wrappers that run this tree's commands, so
+    that commands running other commands run this tree's too
+    '''
+    bin_dir = tempfile.mkdtemp(prefix='mvgit-bench-')
+    for name in os.listdir(package_dir):
+	if not name.startswith('git-') or not name.endswith('.py'):
+	    continue
+	path = os.path.join(bin_dir, name[:-3])
+	file = open(path, 'w')
+	file.write('#!/bin/sh\nexec "%s" "%s" "$@"\n' %
+		   (sys.executable, os.path.join(package_dir, name)))
+	file.close()
+	os.chmod(path, 0755)
+    return bin_dir
+
+
+class Operation(object):
+    '''
+    A timed operation
+
+    setup() and cleanup() run before and after each timed run, and are
+    not timed.  command() returns the command, the directory to run it
+    in, and its standard input.
+    '''
+
+    name = None
+
+    def __init__(self, bench):
+	self.bench = bench
+	self.clone = bench.clone
+	self.server = bench.server
+
+
+    def setup(self):
+	pass
+
+
+    def cleanup(self):
+	pass
+
+
+    def script(self, name):
+	return [sys.executable, os.path.join(package_dir, name)]
+
+
+class AnalyzeChanges(Operation):
+    name = 'analyze-changes'
+
+    def command(self):
+	return self.script('git-analyze-changes.py') + [limbname], \
+	       self.clone, None
+
+
+class ChangesLimb(Operation):
+    name = 'changes-l'
+
+    def command(self):
+	return self.script('git-changes.py') + ['-l', limbname], \
+	       self.clone, None
+
+
+class Provenance(Operation):
+    name = 'provenance'
+
+    def command(self):
+	branchname = '%s/dev.b%d' % (limbname, self.bench.params['branches'] - 1)
+	return self.script('git-provenance.py') + [branchname], \
+	       self.clone, None
+
+
+class PreReceive(Operation):
+    '''
+    Runs the hook as the server would for a push of the clone's limb
+    '''
+
+    name = 'pre-receive'
+
+    def __init__(self, bench):
+	Operation.__init__(self, bench)
+	user = pwd.getpwuid(os.getuid())[0]
+	for name, value in (('mvista.gatekeepers', user),
+			    ('mvista.gitadmins', user),
+			    ('mvista.dev.push-recipients', 'bench@example.com'),
+			    ('mvista.debug', '0')):
+	    run(['git', 'config', name, value], self.server)
+
+	prefix = 'refs/bench/next/'
+	lines = []
+	output = run(['git', 'for-each-ref', '--format=%(objectname) %(refname)',
+		      prefix + limbname], self.server)
+	for line in output.splitlines():
+	    new, refname = line.split()
+	    refname = 'refs/heads/' + refname[len(prefix):]
+	    old = run(['git', 'rev-parse', refname], self.server).strip()
+	    if old != new:
+		lines.append('%s %s %s\n' % (old, new, refname))
+	self.input = ''.join(lines)
+
+
+    def cleanup(self):
+	logs = os.path.join(self.server, 'limblogs')
+	if os.path.isdir(logs):
+	    shutil.rmtree(logs)
+
+
+    def command(self):
+	hook = os.path.join(package_dir, 'hooks', 'mvlinux', 'pre-receive.py')
+	return [sys.executable, hook], self.server, self.input
+
+
+class ScratchOperation(Operation):
+    '''
+    An operation run on a scratch branch that is reset after each run
+    '''
+
+    scratch = 'bench-scratch'
+    start = '%s/dev.b0' % limbname
+
+    def setup(self):
+	run(['git', 'checkout', '-q', '-B', self.scratch, self.start],
+	    self.clone)
+
+
+    def cleanup(self):
+	dotest = os.path.join(self.clone, '.git', '.dotest')
+	if os.path.isdir(dotest):
+	    shutil.rmtree(dotest)
+	run(['git', 'reset', '-q', '--hard'], self.clone)
+	run(['git', 'checkout', '-q', self.start], self.clone)
+	run(['git', 'branch', '-D', self.scratch], self.clone)
+
+
+class CherryPickMv(ScratchOperation):
+    '''
+    Picks dev.b1's last commits onto dev.b0, without committing them
+    since git-commit-mv isn't part of this tree
+    '''
+
+    name = 'cherry-pick-mv'
+    header_options = ['--source', 'MontaVista Software, LLC',
+		      '--bugz', '1000', '--type', 'Enhancement',
+		      '--disposition', 'Local']
+
+    def command(self):
+	commits = run(['git', 'rev-list', '--reverse', '-5',
+		       '%s/dev.b1' % limbname], self.clone).split()
+	return self.script('git-cherry-pick-mv.py') + ['-n'] + \
+	       self.header_options + commits, self.clone, None
+
+
+class SignoffMv(ScratchOperation):
+    name = 'signoff-mv'
+
+    def command(self):
+	return self.script('git-signoff-mv.py') + ['-f', 'HEAD~5..HEAD'], \
+	       self.clone, None
+
+
+operations = (AnalyzeChanges, ChangesLimb, Provenance, PreReceive,
+	      CherryPickMv, SignoffMv)
+
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    if n % 2:
+	return values[n / 2]
+    return (values[n / 2 - 1] + values[n / 2]) / 2.0
+
+
+class Bench(object):
+    def __init__(self):
+	self.clone = config["clone"]
+	self.server = config["server"]
+	self.params = read_params()
+	self.bin_dir = make_bin_dir()
+	self.trace = os.path.join(self.bin_dir, 'trace')
+
+	env = os.environ.copy()
+	env['PATH'] = '%s%s%s' % (self.bin_dir, os.pathsep, env.get('PATH', ''))
+	env['PYTHONPATH'] = package_dir
+	env['MVGIT_NO_DAEMON'] = '1'
+	env['MVGIT_TRACE'] = self.trace
+	env['FILTER_BRANCH_SQUELCH_WARNING'] = '1'
+	for name in ('MVGIT_PROFILE', 'GIT_DIR', 'GIT_WORK_TREE'):
+	    env.pop(name, None)
+	self.env = env
+
+
+    def time(self, op):
+	'''
+	Run op the configured number of times, returning its results
+	'''
+	times = []
+	processes = None
+	for i in range(config["repeat"]):
+	    op.setup()
+	    cmd, cwd, input = op.command()
+	    env = self.env.copy()
+	    if cwd == self.server:
+		env['GIT_DIR'] = '.'
+	    if os.path.exists(self.trace):
+		os.remove(self.trace)
+	    if config["cold"]:
+		for dirname in (os.path.join(self.clone, '.git'), self.server):
+		    caches = os.path.join(dirname, 'mvgit')
+		    if os.path.isdir(caches):
+			shutil.rmtree(caches)
+
+	    try:
+		start = time.time()
+		run(cmd, cwd, input, env)
+		times.append(time.time() - start)
+	    finally:
+		op.cleanup()
+	    processes = len(open(self.trace).readlines())
+
+	return {
+	    'runs': times,
+	    'min': min(times),
+	    'median': median(times),
+	    'mean': sum(times) / len(times),
+	    'git_processes': processes,
+	}
+
+
+    def run(self):
+	results = {}
+	try:
+	    for cls in operations:
+		if config["ops"] and cls.name not in config["ops"]:
+		    continue
+		sys.stderr.write('%s...' % cls.name)
+		results[cls.name] = self.time(cls(self))
+		sys.stderr.write(' %.3fs\n' % results[cls.name]['median'])
+	finally:
+	    shutil.rmtree(self.bin_dir)
+
+	return {
+	    'params': self.params,
+	    'git_version': run(['git', '--version'], self.clone).strip(),
+	    'python_version': sys.version.split()[0],
+	    'repeat': config["repeat"],
+	    'cold': config["cold"],
+	    'time': int(time.time()),
+	    'operations': results,
+	}
+
+
+def compare(results, filename):
+    '''
+    Report each operation's median relative to that in a baseline
+    '''
+    baseline = json.load(open(filename))
+    if baseline.get('params') != results['params']:
+	sys.stderr.write('Warning: %s has a different layout\n' % filename)
+
+    sys.stderr.write('\n%-16s %10s %10s %8s %12s\n' %
+		     ('operation', 'baseline', 'median', 'ratio', 'processes'))
+    for cls in operations:
+	result = results['operations'].get(cls.name)
+	before = baseline['operations'].get(cls.name)
+	if not result or not before:
+	    continue
+	sys.stderr.write('%-16s %9.3fs %9.3fs %7.2fx %5d -> %-5d\n' %
+			 (cls.name, before['median'], result['median'],
+			  result['median'] / before['median'],
+			  before['git_processes'], result['git_processes']))
+
+
+def main():
+    process_options()
+
+    if config["list"]:
+	for cls in operations:
+	    sys.stdout.write('%s\n' % cls.name)
+	return
+
+    try:
+	results = Bench().run()
+    except BenchError, e:
+	sys.stderr.write('\nError: %s\n' % e)
+	sys.exit(1)
+
+    output = git.json_encode(results) + '\n'
+    if config["output"]:
+	open(config["output"], 'w').write(output)
+    else:
+	sys.stdout.write(output)
+
+    if config["compare"]:
+	compare(results, config["compare"])
+
+
+main()
@@ -10,7 +10,9 @@ Usage: git analyze-limb [options] <limb1>..<limb2>
 	-v		display commit descriptions for each commit
 	-p		display patches with each commit
 	-u <branchname>	Include <branchname> as a reference provider branch
+	-b <subname>	Only analyze the limbs' branches named <subname>
 	-c		display only "created" patches
+	--patch-id	also match rebased commits by their patch ids
 	-h		display this help message
 
 Analyzes the changes between two limbs.
@@ -32,6 +34,7 @@ import getopt
 import sys
 import os
 import re
+import subprocess
 import mvgitlib as git
 
 
@@ -47,9 +50,11 @@ limb2_name = None
 separator = None
 remote_alias = None
 upstream_branchnames = []
+only_subnames = []
 paths = []
 patch = False
 created_only = False
+match_patches = False
 error_exit = False
 
 
@@ -71,9 +76,9 @@ def usage(msg=None):
 
 def process_options():
     global debug, verbose, limb1_name, limb2_name, separator, paths, patch
-    global created_only, remote_alias
-    short_opts = 'cr:hpu:v'
-    long_opts = [ 'help', 'debug', 'verbose', 'version' ]
+    global created_only, remote_alias, match_patches
+    short_opts = 'b:cr:hpu:v'
+    long_opts = [ 'help', 'debug', 'verbose', 'version', 'patch-id' ]
 
     try:
         options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
@@ -98,10 +103,14 @@ def process_options():
 	    remote_alias = value
 	elif option == '-u':
 	    upstream_branchnames.append(value)
+	elif option == '-b':
+	    only_subnames.append(value.strip('/'))
 	elif option == '-c':
 	    created_only = True
 	    patch = True
 	    verbose = True
+	elif option == '--patch-id':
+	    match_patches = True
 	else:
 	    usage('Unknown option: %s' % option)
 
@@ -315,7 +324,7 @@ def summarize_commits(branches, action):
 		    note_error('    Error: commit %s has both metadata '
 		    		'and non-metadata files\n' % commit.id)
 
-		if len(commit.parents()) > 1:
+		if len(commit.parent_ids) > 1:
 		    merges.append(commit)
 
 		# Ignore MV header errors older than 1Jan2010
@@ -454,6 +463,51 @@ def file_lines(branch, path):
     return git.call(cmd, stderr=None).splitlines()
 
 
+def last_commit_times(branch, paths):
+    '''
+    Return a dictionary mapping each of paths to the committer time
+    of the most recent commit on branch that modified it.
+
+    All paths are handled by a single history walk, which is stopped
+    as soon as a time has been found for every path.
+    '''
+
+    commit_time = {}
+    remaining = set(paths)
+
+    cmd = ['git', 'log', '-c', '--name-only', '--pretty=format:%ct',
+	    '--remove-empty', branch.name, '--'] + paths
+    p = git.Popen(cmd, stdout=subprocess.PIPE)
+
+    time = None
+    for line in p.stdout:
+	line = line.rstrip('\n')
+	if not line:
+	    continue
+
+	if line.isdigit():
+	    time = int(line)
+	    continue
+
+	# attribute files in subdirectories to the requested directory
+	path = line
+	while path and path not in remaining:
+	    path = os.path.dirname(path)
+	if not path:
+	    continue
+
+	commit_time[path] = time
+	remaining.remove(path)
+	if not remaining:
+	    break
+
+    p.stdout.close()
+    if p.wait() != 0 and remaining:
+	raise git.GitError('failed: %s' % ' '.join(cmd))
+
+    return commit_time
+
+
 def check_kernel_defconfigs(branch):
     '''
     Ensure that each defconfig file in ./configs contains a
@@ -461,37 +515,34 @@ def check_kernel_defconfigs(branch):
     '''
 
     indent = ' ' * 8
-    cmd = ['git', 'ls-tree', '--name-only', '%s:configs' % branch.name]
+    cmd = ['git', 'ls-tree', '%s:configs' % branch.name]
     try:
-	defconfig_names = git.call(cmd, stderr=None).splitlines()
+	entries = git.call(cmd, stderr=None).splitlines()
     except:
 	notice(indent + 'WARNING: No ./configs directory\n')
 	return
 
+    cat_file = git.cat_file()
+
     paths = []
-    commit_time = {}
     checksetconfig = {}
-    for name in defconfig_names:
+    for entry in entries:
+	info, name = entry.split('\t', 1)
+	id = info.split()[2]
 	path = 'configs/%s' % name
 	paths.append(path)
-	for line in file_lines(branch, path):
-	    if line == '# checksetconfig':
-		checksetconfig[path] = True
-		break
-	else:
-	    checksetconfig[path] = False
-
-	cmd = ['git', 'log', '-1', '--pretty=format:%ct',
-		'--remove-empty', branch.name, '--', path]
-	commit_time[path] = int(git.call(cmd).strip())
+	lines = cat_file.read(id).splitlines()
+	checksetconfig[path] = '# checksetconfig' in lines
 
     if paths:
 	baseconfig_path = 'scripts/kconfig/baseconfig'
-	cmd = ['git', 'log', '-1', '--pretty=format:%ct',
-		'--remove-empty', branch.name, '--', baseconfig_path]
-	base_config_time = git.call(cmd)
-	if base_config_time:
-	    base_config_time = int(base_config_time.strip())
+	baseconfig_ref = '%s:%s' % (branch.name, baseconfig_path)
+	if git.object_exists(baseconfig_ref):
+	    commit_time = last_commit_times(branch, paths + [baseconfig_path])
+	    base_config_time = commit_time.get(baseconfig_path)
+	else:
+	    commit_time = last_commit_times(branch, paths)
+	    base_config_time = None
 
 	for path in paths:
 	    if not checksetconfig[path]:
@@ -544,6 +595,9 @@ def do_analyze():
     if limb1_name.startswith(remote_alias + "/"):
 	limb = git.Limb(limb1_name, limb2_name)
 	deleted_branches = limb.deleted_branches
+	if only_subnames:
+	    deleted_branches = [x for x in deleted_branches
+				if x.subname in only_subnames]
 	if deleted_branches:
 	    plural = len(deleted_branches) > 1
 	    sys.stdout.write("The following branch%s in %s\n" %
@@ -584,9 +638,19 @@ def do_analyze():
 	    upstream_branches.append(ub)
 	limb.upstream_branches = upstream_branches
 
+    if match_patches:
+	limb.match_patches = True
+
     deleted_branches = limb.deleted_branches
     created_branches = limb.created_branches
     changed_branches = limb.changed_branches
+    if only_subnames:
+	deleted_branches = [x for x in deleted_branches
+			    if x.subname in only_subnames]
+	created_branches = [x for x in created_branches
+			    if x.subname in only_subnames]
+	changed_branches = [x for x in changed_branches
+			    if x.subname in only_subnames]
     branches_with_new_commits = created_branches + changed_branches
 
     summarize_branches(deleted_branches, 'deleted')
@@ -646,4 +710,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Usage: git-blame-feature [-r <rev>] [-j <jobs>] <FEATURE>
+
+Searches for the word FEATURE in the Kconfig files, and for the word
+CONFIG_FEATURE in all files, of the tree of <rev>, HEAD by default.
+Displays the matching lines, followed by the commits that provide
+them.  FEATURE is intended to be a kernel config option.
+
+	-r <rev>	Search and blame the tree of <rev>
+	-j <jobs>	Run up to <jobs> "git blame" processes at once,
+			4 by default
+"""
+
+import sys
+import getopt
+import subprocess
+import mvgitlib as git
+
+
+config = {
+    "debug"		: False,
+    "rev"		: "HEAD",
+    "jobs"		: 4,
+}
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def process_options():
+    short_opts = "hj:r:"
+    long_opts = ["help", "debug", "version"]
+
+    try:
+	options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+
+    except getopt.GetoptError, err:
+	usage(err)
+
+    for option, value in options:
+	if option == "--help" or option == "-h":
+	    usage()
+	elif option == "--debug":
+	    config["debug"] = True
+	elif option == '--version':
+	    sys.stdout.write('mvgit version %s\n' % "@@MVGIT_VERSION@@")
+	    sys.exit(0)
+	elif option == "-r":
+	    config["rev"] = value
+	elif option == "-j":
+	    try:
+		config["jobs"] = max(1, int(value))
+	    except ValueError:
+		usage("-j requires a number")
+
+    if len(args) != 1:
+	usage()
+
+    config["feature"] = args[0]
+
+
+def grep_word(rev, word):
+    '''
+    Return a (filename, line number, text) tuple for each line of the
+    tree of rev that contains word
+    '''
+    cmd = ['git', 'grep', '-n', '-w', '-z', '-e', word, rev, '--']
+    output = git.call(cmd, error=None)
+
+    prefix = rev + ':'
+    matches = []
+    for line in output.splitlines():
+	filename, lineno, text = line.split('\0', 2)
+	if filename.startswith(prefix):
+	    filename = filename[len(prefix):]
+	matches.append((filename, int(lineno), text))
+    return matches
+
+
+def blame_lines(rev, lines_by_file):
+    '''
+    Return the ids of the commits that provide the given lines of each
+    file, running one "git blame" per file, several at once
+    '''
+    ids = {}
+    filenames = lines_by_file.keys()
+    filenames.sort()
+
+    jobs = config["jobs"]
+    for i in range(0, len(filenames), jobs):
+	started = []
+	for filename in filenames[i:i + jobs]:
+	    cmd = ['git', 'blame', '--porcelain']
+	    for lineno in lines_by_file[filename]:
+		cmd += ['-L', '%d,%d' % (lineno, lineno)]
+	    cmd += [rev, '--', filename]
+	    started.append((cmd, git.Popen(cmd, stdout=subprocess.PIPE)))
+
+	for cmd, process in started:
+	    output = process.communicate()[0]
+	    if process.returncode != 0:
+		raise git.GitError('failed: "%s"' % ' '.join(cmd))
+
+	    # Each blamed line starts with "<id> <line> <line> [<count>]"
+	    for line in output.splitlines():
+		if line.startswith('\t'):
+		    continue
+		words = line.split()
+		if (len(words) in (3, 4) and len(words[0]) == 40 and
+			git.re_commit_id.match(words[0])):
+		    ids[words[0]] = True
+
+    return ids.keys()
+
+
+def write_commits(ids):
+    '''
+    Write the abbreviated id and subject of each commit, in one batch
+    '''
+    ids.sort()
+    cmd = ['git', 'log', '--no-walk=unsorted', '--oneline', '--stdin']
+    process = git.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    output = process.communicate(''.join(['%s\n' % x for x in ids]))[0]
+    if process.returncode != 0:
+	raise git.GitError('failed: "%s"' % ' '.join(cmd))
+    sys.stdout.write(output)
+
+
+def blame_feature():
+    rev = config["rev"]
+    feature = config["feature"]
+
+    if not git.commit_id(rev):
+	raise git.GitError('%s is not a commit' % rev)
+
+    lines_by_file = {}
+    def add_line(filename, lineno):
+	lines_by_file.setdefault(filename, {})[lineno] = True
+
+    sys.stdout.write("Lines matching %s:\n" % feature)
+    for filename, lineno, text in grep_word(rev, feature):
+	sys.stdout.write("%s:%d:%s\n" % (filename, lineno, text))
+	if not filename.endswith('Kconfig'):
+	    sys.stderr.write("warning: %s matched in non-Kconfig file %s!\n" %
+			     (feature, filename))
+	    continue
+	add_line(filename, lineno)
+
+    for filename, lineno, text in grep_word(rev, 'CONFIG_' + feature):
+	sys.stdout.write("%s:%d:%s\n" % (filename, lineno, text))
+	add_line(filename, lineno)
+
+    for filename in lines_by_file:
+	lines = lines_by_file[filename].keys()
+	lines.sort()
+	lines_by_file[filename] = lines
+
+    sys.stdout.write("Commits:\n")
+    sys.stdout.flush()
+    ids = blame_lines(rev, lines_by_file)
+    if ids:
+	write_commits(ids)
+
+
+def main():
+    process_options()
+
+    try:
+	git.check_repository()
+
+	blame_feature()
+
+    except git.GitError, e:
+	sys.stderr.write("\nError: %s\n" % e.msg)
+	sys.stderr.write("Exiting.\n")
+
+	if config["debug"]:
+	    sys.stdout.write("\n")
+	    raise
+
+	sys.exit(1)
+
+
+git.run_main(main)
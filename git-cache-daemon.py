@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+"""
+Usage: git-cache-daemon [--detach]
+       git-cache-daemon --stop
+       git-cache-daemon --status
+	--detach	Run in the background
+	--stop		Stop the daemon running for this repository
+	--status	Report whether a daemon is running for this repository
+
+Runs a daemon that keeps the repository's refs, commits, configuration
+and limb metadata cached in memory.  Commands such as git-changes,
+git-provenance and git-ls-limb are run by the daemon when it is
+running, instead of reading everything again, and run directly
+otherwise.  The daemon reloads its caches when refs or configuration
+change.
+"""
+
+import sys
+import os
+import getopt
+import socket
+import select
+import signal
+import errno
+import fcntl
+import time
+import traceback
+import atexit
+import mvgitlib as git
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+config = {
+    "debug"		: False,
+    "detach"		: False,
+    "stop"		: False,
+    "status"		: False,
+}
+
+pending_timeout = 30		# seconds to wait for a client's connections
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def process_options():
+    short_opts = "h"
+    long_opts = ["help", "debug", "version", "detach", "stop", "status"]
+
+    try:
+	options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+
+    except getopt.GetoptError, err:
+	usage(err)
+
+    for option, value in options:
+	if option == "--help" or option == "-h":
+	    usage()
+	elif option == "--debug":
+	    config["debug"] = True
+	elif option == '--version':
+	    sys.stdout.write('mvgit version %s\n' % "@@MVGIT_VERSION@@")
+	    sys.exit(0)
+	elif option == "--detach":
+	    config["detach"] = True
+	elif option == "--stop":
+	    config["stop"] = True
+	elif option == "--status":
+	    config["status"] = True
+
+    if args:
+	usage()
+
+
+def connect(path):
+    '''
+    Return a socket connected to the daemon, or None if it isn't running
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+	sock.connect(path)
+    except socket.error:
+	sock.close()
+	return None
+    return sock
+
+
+def config_mtimes():
+    '''
+    Return the modification times of the files holding git configuration
+    '''
+    mtimes = []
+    for path in (os.path.join(git.git_dir(), 'config'),
+		 os.path.expanduser('~/.gitconfig'), '/etc/gitconfig'):
+	try:
+	    mtimes.append(os.stat(path).st_mtime)
+	except OSError:
+	    mtimes.append(None)
+    return mtimes
+
+
+class Daemon(object):
+    '''
+    Accepts commands on the socket and runs each in a forked child
+
+    A client makes three connections: a "run" connection carrying the
+    command, and "stdout" and "stderr" connections that become the
+    child's output.  The connections are paired by a token chosen by
+    the client.  The command's exit status is returned on the "run"
+    connection when the child exits.
+
+    Each child inherits the daemon's caches, and any changes it makes
+    to them are discarded when it exits, except for the persistent
+    caches that it saves and the daemon later reloads.
+    '''
+
+    def __init__(self, listener):
+	self.listener = listener
+	self.pending = {}		# token -> {kind: connection}
+	self.children = {}		# pid -> run connection
+	self.config_mtimes = config_mtimes()
+
+	# SIGCHLD writes to this pipe, waking serve() to reap the child
+	self.wakeup = os.pipe()
+	for fd in self.wakeup:
+	    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+	    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+	signal.signal(signal.SIGCHLD, self.child_exited)
+	if hasattr(signal, 'siginterrupt'):
+	    signal.siginterrupt(signal.SIGCHLD, False)
+
+	git.ref_table = git.RefTable()
+	self.warm(git.branchnames(recursive=True))
+
+
+    def child_exited(self, signum, frame):
+	try:
+	    os.write(self.wakeup[1], 'x')
+	except OSError:
+	    pass			# the pipe is full, so serve() will wake
+
+
+    def warm(self, names):
+	'''
+	Read the commits of the named branches since their merge bases
+
+	The commits, commit ranges, resolved names and metadata stay
+	cached, while the Ref and Limb objects created to find them are
+	discarded so that each command creates its own.
+	'''
+	for name in names:
+	    try:
+		branch = git.Branch.get(name)
+		if branch.id:
+		    branch.commits
+	    except Exception, e:
+		sys.stderr.write('git-cache-daemon: warming %s: %s\n' %
+				 (name, e))
+		if config["debug"]:
+		    traceback.print_exc()
+
+	git.Ref.ref_dict.clear()
+	git.Limb.limb_dict.clear()
+	git.save_caches()
+
+
+    def refresh(self):
+	'''
+	Bring the caches up to date before running a command
+	'''
+	mtimes = config_mtimes()
+	if mtimes != self.config_mtimes:
+	    self.config_mtimes = mtimes
+	    git.forget_config()
+
+	git.forget_stale_caches()
+
+	old_ids = git.ref_table.ids
+	if git.ref_table.reload():
+	    git.forget_refs()
+	    ids = git.ref_table.ids
+	    names = []
+	    for name, refname in zip(git.ref_table.branchnames(),
+				     git.ref_table.branch_refnames()):
+		if ids[refname] != old_ids.get(refname):
+		    names.append(name)
+	    self.warm(names)
+
+
+    def serve(self):
+	while True:
+	    self.reap()
+	    self.expire_pending()
+
+	    timeout = None
+	    if self.pending:
+		timeout = 1
+	    try:
+		readable = select.select([self.listener, self.wakeup[0]],
+					 [], [], timeout)[0]
+	    except select.error, e:
+		if e[0] == errno.EINTR:
+		    continue
+		raise
+	    if self.wakeup[0] in readable:
+		try:
+		    os.read(self.wakeup[0], 4096)
+		except OSError:
+		    pass
+	    if self.listener not in readable:
+		continue
+
+	    conn = self.listener.accept()[0]
+	    try:
+		if not self.receive(conn):
+		    break
+	    except (socket.error, ValueError, IndexError, pickle.PickleError):
+		conn.close()
+
+	for conn in self.children.values():
+	    conn.close()
+
+
+    def receive(self, conn):
+	'''
+	Read the header of a new connection, and run the command once
+	all three of its connections have arrived
+
+	Returns False if the daemon was asked to stop.
+	'''
+	conn.settimeout(5)
+	header = ''
+	while not header.endswith('\n'):
+	    data = conn.recv(1)
+	    if not data:
+		raise ValueError('incomplete header')
+	    header += data
+	fields = header.split()
+	kind, token = fields[0], fields[1]
+
+	if kind == 'stop':
+	    conn.close()
+	    return False
+
+	if kind == 'run':
+	    length = int(fields[2])
+	    data = ''
+	    while len(data) < length:
+		chunk = conn.recv(length - len(data))
+		if not chunk:
+		    raise ValueError('incomplete request')
+		data += chunk
+	    conn = (conn, pickle.loads(data))
+	elif kind not in ('stdout', 'stderr'):
+	    raise ValueError('unknown request')
+
+	if token not in self.pending:
+	    self.pending[token] = {'time': time.time()}
+	self.pending[token][kind] = conn
+
+	if len(self.pending[token]) == 4:
+	    self.run(self.pending.pop(token))
+	return True
+
+
+    def expire_pending(self):
+	now = time.time()
+	for token, conns in self.pending.items():
+	    if now - conns['time'] > pending_timeout:
+		del self.pending[token]
+		close_connections(conns)
+
+
+    def run(self, conns):
+	ctl, request = conns['run']
+	out = conns['stdout']
+	err = conns['stderr']
+	out.settimeout(None)		# the child's output must block
+	err.settimeout(None)
+
+	self.refresh()
+
+	sys.stdout.flush()
+	sys.stderr.flush()
+	pid = os.fork()
+	if pid == 0:
+	    status = 1
+	    try:
+		try:
+		    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+		    for fd in self.wakeup:
+			os.close(fd)
+		    self.listener.close()
+		    ctl.close()
+		    for conn in self.children.values():
+			conn.close()
+		    for conns in self.pending.values():
+			close_connections(conns)
+		    os.dup2(out.fileno(), 1)
+		    os.dup2(err.fileno(), 2)
+		    out.close()
+		    err.close()
+		    dev_null = os.open('/dev/null', os.O_RDONLY)
+		    os.dup2(dev_null, 0)
+		    os.close(dev_null)
+		    status = run_command(request)
+		except:
+		    traceback.print_exc()
+	    finally:
+		os._exit(status)
+
+	out.close()
+	err.close()
+	self.children[pid] = ctl
+
+
+    def reap(self):
+	while self.children:
+	    try:
+		pid, status = os.waitpid(-1, os.WNOHANG)
+	    except OSError:
+		return
+	    if not pid:
+		return
+	    if os.WIFEXITED(status):
+		status = os.WEXITSTATUS(status)
+	    else:
+		status = 128 + os.WTERMSIG(status)
+	    ctl = self.children.pop(pid, None)
+	    if ctl:
+		try:
+		    ctl.sendall('exit %d\n' % status)
+		except socket.error:
+		    pass
+		ctl.close()
+
+
+def close_connections(conns):
+    for kind, conn in conns.items():
+	if kind == 'run':
+	    conn[0].close()
+	elif kind != 'time':
+	    conn.close()
+
+
+def run_command(request):
+    '''
+    Run a command's script in this (forked) process, returning its status
+    '''
+    git.in_daemon = True
+    git.cached_cat_file = None		# the daemon's process isn't ours
+
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    git.trace_from_environment()
+    sys.argv = request['argv']
+    sys.stdout = os.fdopen(1, 'w')
+    sys.stderr = os.fdopen(2, 'w')
+
+    script = request['script']
+    status = 0
+    try:
+	execfile(script, {'__name__': '__main__', '__file__': script})
+    except SystemExit, e:
+	if e.code is None:
+	    status = 0
+	elif isinstance(e.code, int):
+	    status = e.code
+	else:
+	    sys.stderr.write('%s\n' % e.code)
+	    status = 1
+    except:
+	traceback.print_exc()
+	status = 1
+
+    atexit._run_exitfuncs()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return status
+
+
+def detach():
+    '''
+    Continue running in a background process
+    '''
+    if os.fork():
+	os._exit(0)
+    os.setsid()
+    if os.fork():
+	os._exit(0)
+
+    dev_null = os.open('/dev/null', os.O_RDWR)
+    for fd in (0, 1, 2):
+	os.dup2(dev_null, fd)
+    os.close(dev_null)
+
+
+def cache_daemon():
+    path = git.daemon_socket_path()
+
+    if config["status"]:
+	sock = connect(path)
+	if sock:
+	    sock.close()
+	    sys.stdout.write('running\n')
+	else:
+	    sys.stdout.write('not running\n')
+	    sys.exit(1)
+	return
+
+    if config["stop"]:
+	sock = connect(path)
+	if not sock:
+	    raise git.GitError('no cache daemon is running')
+	sock.sendall('stop %d\n' % os.getpid())
+	sock.close()
+	return
+
+    sock = connect(path)
+    if sock:
+	sock.close()
+	raise git.GitError('a cache daemon is already running')
+    if os.path.exists(path):
+	os.unlink(path)
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+	os.makedirs(dirname)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0600)
+    listener.listen(16)
+
+    if config["detach"]:
+	detach()
+
+    try:
+	Daemon(listener).serve()
+    finally:
+	listener.close()
+	try:
+	    os.unlink(path)
+	except OSError:
+	    pass
+
+
+def main():
+    process_options()
+
+    try:
+	git.check_repository()
+	git.require_mvl6_kernel_repo()
+
+	cache_daemon()
+
+    except git.GitError, e:
+	sys.stderr.write("\nError: %s\n" % e.msg)
+	sys.stderr.write("Exiting.\n")
+
+	if config["debug"]:
+	    sys.stdout.write("\n")
+	    raise
+
+	sys.exit(1)
+
+
+git.run_main(main)
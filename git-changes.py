@@ -1,14 +1,18 @@
 #!/usr/bin/env python
 """
-Usage: git-changes [-l] [-v] [-a] [<left>] [<right>]
+Usage: git-changes [-v] [-a] [--patch-id] [-p <pattern>]...
+       git-changes [-v] [-a] [--patch-id] <left> [<right>]
+       git-changes -l [-v] [-a] [--patch-id] [-p <pattern>]... [<limb> ...]
        git-changes --dependents <branch> [<limb> ...]
 
 If -l is specified:
-    <right> must not be specified.  The limb specified by <left>
-    (the current limb, if <left> is omitted) is examined.  Each
-    of the limb's branches that has pending changes from one or
+    Each <limb> (the current limb, if none is given) is examined.
+    Each of the limb's branches that has pending changes from one or
     more branches is listed, followed by the status of each
-    branch on which it depends.
+    branch on which it depends.  The limbs are examined in this one
+    process, so the commits and changes of branches that several
+    limbs depend on, such as upstream and external branches, are
+    only read once.
 
 If -l is not specified:
     If <left> is not specified, the name of the current branch is listed,
@@ -25,6 +29,15 @@ one-per-line in the file MONTAVISTA/rejected_changes in the destination
 branch are omitted.  When -a is specified, all changes, including
 those in MONTAVISTA/rejected_changes are included in the output.
 
+If --patch-id is specified, changes are also matched by content.
+A commit whose patch matches that of a commit in the destination
+branch is not pending, even if the two commits' ChangeIDs differ.
+
+If -p is specified, only the branches depended on whose names, or
+whose names within their limbs, match the shell wildcard <pattern>
+are examined, e.g. "external.*".  -p may be given more than once,
+and only with -l or without <left>.
+
 Format of pending change status:
     Each line of change status consists of two integers, separated by
     a plus (+) sign, followed by the name of the branch containing the
@@ -48,7 +61,9 @@ If --dependents is specified:
 """
 
 import sys
+import os
 import getopt
+import fnmatch
 import re
 import mvgitlib as git
 
@@ -60,8 +75,10 @@ config = {
     "left"		: None,
     "right"		: None,
     "with_rejects"	: False,
+    "match_patches"	: False,
     "dependents"	: None,
     "limbs"		: [],
+    "providers"		: [],
 }
 
 
@@ -78,8 +95,9 @@ def usage(msg=None):
 
 
 def process_options():
-    short_opts = "ahlv"
-    long_opts = ["help", "debug", "dependents=", "version"]
+    short_opts = "ahlp:v"
+    long_opts = ["help", "debug", "dependents=", "patch-id", "provider=",
+		 "version"]
 
     try:
         options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
@@ -103,8 +121,16 @@ def process_options():
 	    config["with_rejects"] = True
 	elif option == "--dependents":
 	    config["dependents"] = value
+	elif option == "--patch-id":
+	    config["match_patches"] = True
+	elif option == "-p" or option == "--provider":
+	    config["providers"].append(value)
 
-    if config["dependents"]:
+    if config["providers"] and (config["dependents"] or
+				(args and not config["limb"])):
+	usage("-p requires -l or no <left>")
+
+    if config["dependents"] or config["limb"]:
 	config["limbs"] = args
 	return
 
@@ -115,8 +141,6 @@ def process_options():
 	config["left"] = args[0]
 
     if len(args) > 1:
-	if config["limb"]:
-	    usage()
 	config["right"] = args[1]
 
 
@@ -124,6 +148,7 @@ def git_pending_commits():
     left = config["left"]
     right = config["right"]
     with_rejects = config["with_rejects"]
+    match_patches = config["match_patches"]
 
     if right:
 	right = git.Branch(right)
@@ -146,7 +171,8 @@ def git_pending_commits():
 	sys.stderr.write("Invalid upstream_version for %s\n" % left.name)
 	sys.exit(1)
 
-    commits = git.changeid_diff(left, right, with_rejects=with_rejects)
+    commits = git.changeid_diff(left, right, with_rejects=with_rejects,
+				match_patches=match_patches)
 
     if (not left.has_branch_merge_base() and commits
         and not commits[0].contains(left_base)):
@@ -177,10 +203,33 @@ def valid_provider(branch, provider):
 
     return provider
 
+
+def selected_providers(branch):
+    '''
+    Return the providers of branch, only those matching a -p pattern
+    if any were given
+    '''
+    patterns = config["providers"]
+
+    providers = []
+    for prov in branch.providers:
+	if patterns:
+	    names = [prov.name, os.path.basename(prov.name)]
+	    for pattern in patterns:
+		if fnmatch.filter(names, pattern):
+		    break
+	    else:
+		continue
+	providers.append(valid_provider(branch, prov))
+
+    return providers
+
+
 cached_change_count = {}
 
 def change_count(left, right):
     with_rejects = config["with_rejects"]
+    match_patches = config["match_patches"]
 
     if (left, right) in cached_change_count:
 	return cached_change_count[(left, right)]
@@ -188,7 +237,8 @@ def change_count(left, right):
     if 'reference' in right.provider_flags[left]:
 	count = 0
     else:
-	count = len(git.changeid_diff(left, right, with_rejects=with_rejects))
+	count = len(git.changeid_diff(left, right, with_rejects=with_rejects,
+				      match_patches=match_patches))
 
     cached_change_count[(left, right)] = count
 
@@ -215,8 +265,7 @@ def recursive_change_count(branch):
 def git_pending_branch(branch):
     total_changes = 0
 
-    for prov in branch.providers:
-	prov = valid_provider(branch, prov)
+    for prov in selected_providers(branch):
 	changes = change_count(prov, branch)
 	rchanges = recursive_change_count(prov)
 	if (changes or rchanges) and not total_changes:
@@ -234,15 +283,14 @@ def git_pending_branch(branch):
     return total_changes
 
 
-def git_pending_limb():
+def git_pending_limb(limb):
+    '''
+    Report the pending changes of the limb's branches, and return True
+    if the report ends with a blank line
+    '''
     verbose = config["verbose"]
 
-    limb = config["left"]
-    if limb:
-	limb = git.Limb.get(limb)
-    else:
-	limb = git.current_limb()
-
+    blank = False
     total_changes = 0
     for branch in limb.repository_branches:
 	if not verbose:
@@ -250,8 +298,7 @@ def git_pending_limb():
 		continue
 	    if 'deferred' in branch.flags:
 		continue
-	    for prov in branch.providers:
-		prov = valid_provider(branch, prov)
+	    for prov in selected_providers(branch):
 		if change_count(prov, branch) or recursive_change_count(prov):
 		    break
 	    else:
@@ -259,12 +306,32 @@ def git_pending_limb():
 
 	branch_changes = git_pending_branch(branch)
 	total_changes += branch_changes
+	blank = False
 
 	if branch_changes and branch != limb.repository_branches[-1]:
 	    sys.stdout.write("\n")
+	    blank = True
 
     if not total_changes:
 	sys.stdout.write("No pending changes in %s/\n" % limb.name)
+	blank = False
+
+    return blank
+
+
+def git_pending_limbs():
+    limbs = config["limbs"]
+    if limbs:
+	limbs = [git.Limb.get(x.strip('/')) for x in limbs]
+    else:
+	limbs = [git.current_limb()]
+
+    # separate the limbs' reports by a blank line
+    blank = True
+    for limb in limbs:
+	if not blank:
+	    sys.stdout.write("\n")
+	blank = git_pending_limb(limb)
 
 
 def git_dependent_branches():
@@ -286,6 +353,7 @@ def git_dependent_branches():
 
 
 def main():
+    git.run_in_daemon()
     process_options()
 
     try:
@@ -295,7 +363,7 @@ def main():
 	if config["dependents"]:
 	    git_dependent_branches()
 	elif config["limb"]:
-	    git_pending_limb()
+	    git_pending_limbs()
 	else:
 	    if config["left"]:
 		git_pending_commits()
@@ -313,4 +381,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
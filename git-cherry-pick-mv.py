@@ -191,7 +191,7 @@ def checkout_original_branch():
 	    git.call(cmd)
 	prefix_len = len('refs/heads/')
 	cmd = ["git", "checkout", config["orig_branchname"][prefix_len:]]
-	p = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+	p = git.Popen(cmd, stderr=subprocess.PIPE)
 	errmsg = p.stderr.read()
 	rc = p.wait()
 	if 'Switched to branch ' not in errmsg:
@@ -445,7 +445,7 @@ def do_cherry_pick(commit):
     cmd = ['git', '--no-pager', 'log', '-1', '--pretty=format:%h %s\n', commit]
     git.call(cmd, stdout=sys.stdout)
     cmd = ["git", "cherry-pick", "-n"] + cherry_options + [commit]
-    p = subprocess.Popen(cmd, stdout=sys.stdout, stderr=subprocess.PIPE)
+    p = git.Popen(cmd, stdout=sys.stdout, stderr=subprocess.PIPE)
     errmsg = p.stderr.read()
     rc = p.wait()
     if errmsg == 'Finished one cherry-pick.\n':
@@ -473,7 +473,7 @@ def do_cherry_pick(commit):
 
 def changes_added_to_index():
     cmd = ["git", "diff", "--quiet", "--cached"]
-    rc = subprocess.call(cmd)
+    rc = git.Popen(cmd).wait()
     return rc != 0
 
 
@@ -510,7 +510,7 @@ def do_commit(commit):
 	    return
 
 	cmd += ['-c', commit]
-	p = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+	p = git.Popen(cmd, stderr=subprocess.PIPE)
 	output = ""
     else:
 	if config['nocommit']:
@@ -518,7 +518,7 @@ def do_commit(commit):
 	    return
 
 	cmd += ['--no-edit', '-C', commit]
-	p = subprocess.Popen(cmd, stdout=subprocess.PIPE,stderr=subprocess.PIPE)
+	p = git.Popen(cmd, stdout=subprocess.PIPE,stderr=subprocess.PIPE)
 	output = p.stdout.read()
 
     errmsg = p.stderr.read()
@@ -607,4 +607,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
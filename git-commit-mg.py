@@ -189,14 +189,14 @@ def process_options():
 
 def generate_changeid(header, body):
     hcmd = ['git', 'hash-object', '--stdin']
-    hash = subprocess.Popen(hcmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    hash = git.Popen(hcmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
     hash.stdin.write(header)
     hash.stdin.write(body)
     timestr = time.asctime()
     hash.stdin.write(timestr)
 
     pcmd = ['git', 'rev-list', '-1', 'HEAD^0']
-    parent = subprocess.Popen(pcmd, stdout=subprocess.PIPE)
+    parent = git.Popen(pcmd, stdout=subprocess.PIPE)
     data = parent.stdout.read()
     hash.stdin.write(data)
     rc = parent.wait()
@@ -204,7 +204,7 @@ def generate_changeid(header, body):
 	raise Exception("Command %s returned %d\n" % (" ".join(pcmd), rc))
 
     dcmd = ['git', 'diff', '--cached', 'HEAD^0']
-    diff = subprocess.Popen(dcmd, stdout=subprocess.PIPE)
+    diff = git.Popen(dcmd, stdout=subprocess.PIPE)
     while True:
 	data = diff.stdout.read(4096)
 	if len(data) == 0:
@@ -216,7 +216,7 @@ def generate_changeid(header, body):
 
     if opt["commit_all"]:
 	dcmd = ['git', 'diff']
-	diff = subprocess.Popen(dcmd, stdout=subprocess.PIPE)
+	diff = git.Popen(dcmd, stdout=subprocess.PIPE)
 	while True:
 	    data = diff.stdout.read(4096)
 	    if len(data) == 0:
@@ -345,7 +345,7 @@ def commit_mv():
     commit_options += ["--file", msgfile.name]
 
     cmd = ['git', 'commit'] + commit_options
-    commit = subprocess.Popen(cmd)
+    commit = git.Popen(cmd)
     rc = commit.wait()
     msgfile.close()
 
@@ -375,4 +375,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
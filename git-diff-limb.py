@@ -162,4 +162,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Usage: git-fetch-limb [[-b <branch>]...] [<remote_repository>] <limb>...
+
+Update the remote-tracking branches of each <limb> from
+<remote_repository>, origin by default.  Only the branches of each
+limb and of its sublimbs, the branches of the parent limb of each
+bugfixes limb, and each <branch> are fetched.  Remote-tracking
+branches of those whose branches no longer exist in the remote
+repository are deleted, as "git remote prune" would.  The upstream
+version tags of the limbs are fetched if they are missing.
+
+A <limb> that names a branch stands for the branch's limb.
+"""
+
+import sys
+import getopt
+import mvgitlib as git
+
+
+config = {
+    "debug"		: False,
+    "branchnames"	: [],
+}
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def process_options():
+    short_opts = "b:h"
+    long_opts = ["help", "debug", "version", "branch="]
+
+    try:
+	options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+
+    except getopt.GetoptError, err:
+	usage(err)
+
+    for option, value in options:
+	if option == "--help" or option == "-h":
+	    usage()
+	elif option == "--debug":
+	    config["debug"] = True
+	elif option == '--version':
+	    sys.stdout.write('mvgit version %s\n' % "@@MVGIT_VERSION@@")
+	    sys.exit(0)
+	elif option == "-b" or option == "--branch":
+	    config["branchnames"].append(value)
+
+    if not args:
+	usage()
+
+    config["args"] = args
+
+
+def fetch_limb():
+    args = config["args"]
+    if len(args) > 1 and git.config().get('remote.%s.url' % args[0]):
+	repo = args[0]
+	limbnames = args[1:]
+    else:
+	repo = git.remote_alias()
+	limbnames = args
+
+    prefix = repo + '/'
+    limbnames = [(x.startswith(prefix) and x[len(prefix):]) or x
+		 for x in limbnames]
+
+    git.fetch_limbs(repo, limbnames, config["branchnames"])
+
+
+def main():
+    process_options()
+
+    try:
+	git.check_repository()
+	git.require_mvl6_kernel_repo()
+
+	fetch_limb()
+
+    except git.GitError, e:
+	sys.stderr.write("\nError: %s\n" % e.msg)
+	sys.stderr.write("Exiting.\n")
+
+	if config["debug"]:
+	    sys.stdout.write("\n")
+	    raise
+
+	sys.exit(1)
+
+
+git.run_main(main)
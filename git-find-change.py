@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+Usage: git-find-change [-t] [[-l <limb>]...] [[-b <bugz>]...]
+			[<changeID>|<commitID>]...
+       git-find-change --update
+
+For each given change, this command displays the change's changeID
+followed by the commit ID and branch name of each limb branch that
+carries the change.  Each commit ID and branch name is preceded by
+whitespace and separated by a space, as in the output of
+git-provenance.
+
+The changes are found in an index of the limb branches, kept in the
+repository and updated from the branches that moved since it was last
+used, so that each query reads only the commits that weren't indexed.
+
+OPTIONS
+-------
+<changeID>::
+	A change to find.
+
+<commitID>::
+	A commit, or an abbreviated commit ID, whose change to find.
+
+-b <bugz>::
+	Find all changes whose commits have the given bugz.
+
+-l <limb>::
+	Only display branches in <limb> and its sublimbs.
+
+-t::
+	Terse.  Display each change and the names of the branches
+	carrying it on one line.
+
+--update::
+	Only bring the index up to date.
+"""
+
+import sys
+import getopt
+import re
+import mvgitlib as git
+
+
+config = {
+    "terse"		: False,
+    "debug"		: False,
+    "update"		: False,
+    "limbnames"		: [],
+    "bugzs"		: [],
+    "names"		: [],
+}
+
+re_changeid = re.compile(r'[0-9a-f]{40}$')
+re_abbrev = re.compile(r'[0-9a-f]{4,39}$')
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def process_options():
+    short_opts = "b:hl:t"
+    long_opts = ["help", "debug", "version", "update"]
+
+    try:
+	options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+
+    except getopt.GetoptError, err:
+	usage(err)
+
+    for option, value in options:
+	if option == "--help" or option == "-h":
+	    usage()
+	elif option == "--debug":
+	    config["debug"] = True
+	elif option == '--version':
+	    sys.stdout.write('mvgit version %s\n' % "@@MVGIT_VERSION@@")
+	    sys.exit(0)
+	elif option == "--update":
+	    config["update"] = True
+	elif option == "-b":
+	    config["bugzs"].append(value)
+	elif option == "-l":
+	    config["limbnames"].append(value.rstrip('/'))
+	elif option == "-t":
+	    config["terse"] = True
+
+    config["names"] = args
+
+    if config["update"]:
+	if args or config["bugzs"]:
+	    usage()
+    elif not args and not config["bugzs"]:
+	usage()
+
+
+def changeids_for_name(index, name):
+    '''
+    Return the changeids named by name: a changeid, a commit ID,
+    an abbreviated commit ID or another name of a commit
+    '''
+    if re_changeid.match(name):
+	if name in index.locations:
+	    return [name]
+	if not git.object_exists(name):
+	    return [name]		# a changeid that isn't on any branch
+    elif re_abbrev.match(name):
+	ids = index.commits_with_prefix(name)
+	if len(ids) > 1:
+	    raise git.GitError('%s is ambiguous' % name)
+	if ids:
+	    return [index.changeid(ids[0])]
+
+    id = git.commit_id(name)
+    if id:
+	return [index.changeid(id)]
+
+    raise git.GitError('%s is not a changeID or commit' % name)
+
+
+def in_limbs(branchname):
+    limbnames = config["limbnames"]
+    if not limbnames:
+	return True
+    for limbname in limbnames:
+	if branchname.startswith(limbname + '/'):
+	    return True
+    return False
+
+
+def find_change():
+    index = git.change_index()
+    index.update()
+
+    if config["update"]:
+	return 0
+
+    changeids = []
+    for name in config["names"]:
+	changeids += changeids_for_name(index, name)
+    named = dict.fromkeys(changeids)
+    for bugz in config["bugzs"]:
+	changeids += index.changeids_with_bugz(bugz)
+
+    seen = {}
+    status = 0
+    for changeid in changeids:
+	if changeid in seen:
+	    continue
+	seen[changeid] = True
+
+	branches = index.branches_with_change(changeid)
+	names = [x for x in branches if in_limbs(x)]
+	names.sort()
+	if not names:
+	    # the changes of a bugz are only looked for in the limbs
+	    if changeid in named:
+		sys.stderr.write('Change %s not found\n' % changeid)
+		status = 1
+	    continue
+
+	if config["terse"]:
+	    sys.stdout.write('%s %s\n' % (changeid, ' '.join(names)))
+	    continue
+
+	sys.stdout.write('%s\n' % changeid)
+	for name in names:
+	    sys.stdout.write('  %s %s\n' % (branches[name], name))
+	sys.stdout.write('\n')
+
+    return status
+
+
+def main():
+    git.run_in_daemon()
+    process_options()
+
+    try:
+	git.check_repository()
+	git.require_mvl6_kernel_repo()
+
+	status = find_change()
+
+    except git.GitError, e:
+	sys.stderr.write("\nError: %s\n" % e.msg)
+	sys.stderr.write("Exiting.\n")
+
+	if config["debug"]:
+	    sys.stdout.write("\n")
+	    raise
+
+	sys.exit(1)
+
+    sys.exit(status)
+
+
+git.run_main(main)
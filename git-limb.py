@@ -365,4 +365,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
@@ -215,4 +215,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
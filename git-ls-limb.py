@@ -109,6 +109,7 @@ def git_ls_limb():
 
 
 def main():
+    git.run_in_daemon()
     process_options()
 
     try:
@@ -128,4 +129,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
@@ -168,4 +168,4 @@ def main():
         sys.exit(1)
 
 
-main()
+git.run_main(main)
@@ -4,6 +4,7 @@
    	-r <repo>
 	-s <since>
 	--retries=N
+	-j, --jobs=N
 	-f
 
 Places a series of patches in <output_dir> corresponding to the commits
@@ -18,14 +19,23 @@ build environment for mvl6.  --retries may be used to specify that
 such failed calls be repeated N times.
 
 If <output_dir> exists and is not empty, git-mvl6-releasify fails
-unless -f is specified.
+unless -f is specified.  If <output_dir> holds a previous output, only
+its patches are replaced, and of the MONTAVISTA/bitbake files, listed
+in <output_dir>/.releasify-manifest, only those that changed are
+written or removed.
+
+The patches are kept by commit id in the repository's git directory,
+along with those found in <output_dir> when -f is specified, and are
+copied into <output_dir> instead of being made again.  The new patches
+are made by N "git format-patch" processes at once, 4 by default.
+Kept patches that no release has used for 30 days are removed.
 """
 
 import getopt
 import sys
 import os
 import re
-import tarfile
+import tempfile
 import time
 import shutil
 
@@ -35,8 +45,14 @@ config = {
     "dry-run"		: False,		# produce no output
     "retries"		: 0,			# subprocess retries
     "force"		: False,		# overwrite <output_dir>
+    "jobs"		: 4,			# format-patch processes
 }
 
+cache_max_age = 30 * 24 * 3600	# seconds a kept patch may go unused
+
+re_id = re.compile(r'[0-9a-f]{40}$')
+re_numbered_patch = re.compile(r'\d+-(.+\.patch)$')
+
 
 def usage(msg=None):
     """
@@ -120,8 +136,8 @@ def process_options():
     def rmtree_error(func, path, exc_info):
 	sys.stderr.write("Cannot remove %s\n" % path)
 
-    short_opts = "fhnr:s:"
-    long_opts = ["debug", "retries=", "dry-run", "version"]
+    short_opts = "fhj:nr:s:"
+    long_opts = ["debug", "retries=", "dry-run", "version", "jobs="]
 
     try:
         options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
@@ -144,6 +160,11 @@ def process_options():
 	    config["dry-run"] = True
 	elif option == "--retries":
 	    config["retries"] = int(value)
+	elif option == "-j" or option == "--jobs":
+	    try:
+		config["jobs"] = max(1, int(value))
+	    except ValueError:
+		usage("--jobs requires a number")
         elif option == "-r":
 	    repo = value
         elif option == "-f":
@@ -169,10 +190,22 @@ def process_options():
 	    sys.stderr.write("failed: chdir %s\n" % repo)
 	    sys.exit(1)
 
+    cache = patch_cache()
+    config["cache"] = cache
+
     forced = False
     if os.path.isdir(output_dir) and os.listdir(output_dir):
-	if config["force"]:
+	if config["force"] and Manifest(output_dir).exists():
+	    # keep the metadata for copy_metadata() to update
+	    patch_dir = os.path.join(output_dir, "recipes/linux/patches")
+	    keep_patches(patch_dir, cache)
+	    if os.path.isdir(patch_dir):
+		shutil.rmtree(patch_dir)
+	    sys.stdout.write("Updating %s\n" % output_dir)
+	elif config["force"]:
 	    forced = True
+	    keep_patches(os.path.join(output_dir, "recipes/linux/patches"),
+			 cache)
 	    rmtree_errors = 0
 	    shutil.rmtree(output_dir, False, rmtree_error)
 	    if rmtree_errors:
@@ -244,6 +277,307 @@ class Commit:
 	self.filenames = filenames
 
 
+class PatchCache:
+    """
+    The patches made by "git format-patch -N", kept by commit id
+
+    A commit's patch doesn't depend on its place in the series, so the
+    patches made for one release are copied into the next instead of
+    being made again.  Each patch is kept in <directory> as <id>-<name>,
+    where <name> is format-patch's name for it, without its number.
+    If <directory> is None, nothing is kept, and each patch is only
+    known by the path it was added with.
+    """
+
+    re_cached_patch = re.compile(r'([0-9a-f]{40})-(.+)$')
+
+    def __init__(self, directory):
+	self.directory = directory
+	self.paths = {}
+	self.names = {}
+	if directory and os.path.isdir(directory):
+	    for filename in os.listdir(directory):
+		match = self.re_cached_patch.match(filename)
+		if match:
+		    id, name = match.groups()
+		    self.paths[id] = os.path.join(directory, filename)
+		    self.names[id] = name
+
+    def has(self, id):
+	return id in self.paths
+
+    def add(self, id, path, name, keep=False):
+	"""
+	Add the patch at path, named name without its number, for commit
+	id.  The file at path is moved into the cache, or copied if keep
+	is True.
+	"""
+	if self.directory:
+	    cached = os.path.join(self.directory, '%s-%s' % (id, name))
+	    if keep:
+		shutil.copyfile(path, cached)
+	    else:
+		os.rename(path, cached)
+	    path = cached
+	self.paths[id] = path
+	self.names[id] = name
+
+    def prune(self, ids, max_age):
+	"""
+	Mark the patches of the commits in ids as used now, and remove
+	the others that haven't been used for max_age seconds
+	"""
+	if not self.directory:
+	    return
+
+	now = time.time()
+	for id, path in self.paths.items():
+	    try:
+		if id in ids:
+		    os.utime(path, None)
+		elif now - os.stat(path).st_mtime > max_age:
+		    os.remove(path)
+		    del self.paths[id]
+		    del self.names[id]
+	    except OSError:
+		pass
+
+
+def patch_cache():
+    """
+    Return the PatchCache in the repository's git directory, or one
+    that keeps nothing if that directory isn't writable or if this is
+    a dry run
+    """
+    if config["dry-run"]:
+	return PatchCache(None)
+
+    git_dir = os.path.abspath(call("git rev-parse --git-dir").strip())
+    directory = os.path.join(git_dir, "mvgit", "releasify-patches")
+    if not os.path.isdir(directory):
+	try:
+	    os.makedirs(directory)
+	except OSError:
+	    directory = None
+    return PatchCache(directory)
+
+
+def keep_patches(patch_dir, cache):
+    """
+    Add the patches of a previous release in patch_dir to the cache
+    """
+    if not cache.directory or not os.path.isdir(patch_dir):
+	return
+
+    for filename in os.listdir(patch_dir):
+	match = re_numbered_patch.match(filename)
+	if not match:
+	    continue
+	path = os.path.join(patch_dir, filename)
+	line = open(path).readline().split()
+	if len(line) < 2 or line[0] != 'From' or not re_id.match(line[1]):
+	    continue
+	if not cache.has(line[1]):
+	    cache.add(line[1], path, match.group(1), keep=True)
+
+
+def make_patches(runs, patch_dir, numbers, cache):
+    """
+    Make the patches for each run of consecutive commits, and add them
+    to the cache.
+
+    The runs are split into config["jobs"] chunks, made by as many
+    "git format-patch" processes running at once, each into its own
+    temporary directory.  If the cache keeps nothing, each patch is
+    moved to its final name in patch_dir, numbered as in numbers,
+    before its temporary directory is removed.
+    """
+
+    directory = cache.directory or patch_dir
+
+    jobs = config["jobs"]
+    count = 0
+    for commits in runs:
+	count += len(commits)
+    size = max(1, (count + jobs - 1) / jobs)
+
+    chunks = []
+    for commits in runs:
+	for i in range(0, len(commits), size):
+	    chunks.append(commits[i:i + size])
+
+    while chunks:
+	batch = chunks[:jobs]
+	chunks = chunks[jobs:]
+
+	started = []
+	for commits in batch:
+	    tmp_dir = tempfile.mkdtemp(prefix="patches-", dir=directory)
+	    cmd = "git format-patch -o %s -%d -N %s" % (
+		    tmp_dir, len(commits), commits[-1].id)
+	    started.append((commits, tmp_dir, cmd, os.popen(cmd)))
+
+	for commits, tmp_dir, cmd, f in started:
+	    output = f.read()
+	    if f.close():
+		# call() reports the failure and retries it if asked to
+		output = call(cmd)
+	    paths = output.splitlines()
+	    if len(paths) != len(commits):
+		raise Exception('%s made %d patches, expected %d\n' %
+				(cmd, len(paths), len(commits)))
+
+	    for commit, path in zip(commits, paths):
+		name = re_numbered_patch.match(os.path.basename(path)).group(1)
+		if not cache.directory:
+		    final_path = os.path.join(patch_dir, "%04d-%s" %
+					      (numbers[commit.id], name))
+		    os.rename(path, final_path)
+		    path = final_path
+		cache.add(commit.id, path, name)
+	    shutil.rmtree(tmp_dir, True)
+
+
+class Manifest:
+    """
+    The metadata files written to an output directory, as a list of the
+    mode and blob id of each path, and the id of the tree they came from
+
+    A sync that doesn't complete leaves the id of the tree it was
+    writing as "pending", so that the next sync also rewrites the paths
+    that it may have changed.
+    """
+
+    filename = ".releasify-manifest"
+
+    def __init__(self, output_dir):
+	self.path = os.path.join(output_dir, self.filename)
+	self.tree = None
+	self.pending = None
+	self.entries = {}
+
+	if not os.path.isfile(self.path):
+	    return
+
+	for line in open(self.path):
+	    line = line.rstrip('\n')
+	    if line.startswith('tree '):
+		self.tree = line[5:]
+	    elif line.startswith('pending '):
+		self.pending = line[8:]
+	    elif '\t' in line:
+		info, path = line.split('\t', 1)
+		self.entries[path] = tuple(info.split())
+
+    def exists(self):
+	return bool(self.tree)
+
+    def write(self, tree, entries, pending=None):
+	tmp_path = self.path + ".tmp"
+	file = open(tmp_path, "w")
+	file.write("tree %s\n" % tree)
+	if pending:
+	    file.write("pending %s\n" % pending)
+	paths = entries.keys()
+	paths.sort()
+	for path in paths:
+	    file.write("%s %s\t%s\n" % (entries[path][0], entries[path][1], path))
+	file.close()
+	os.rename(tmp_path, self.path)
+	self.tree = tree
+	self.pending = pending
+	self.entries = entries
+
+
+def tree_entries(tree):
+    """
+    Return a dict of the (mode, id) of each blob in tree, by path
+    """
+    entries = {}
+    output = call("git ls-tree -r -z %s" % tree)
+    for record in output.split('\0'):
+	if not record:
+	    continue
+	info, path = record.split('\t', 1)
+	mode, type, id = info.split()
+	if type == 'blob':
+	    entries[path] = (mode, id)
+    return entries
+
+
+def read_blobs(ids):
+    """
+    Return a dict of the contents of the blobs with the given ids, read
+    by a single "git cat-file --batch"
+    """
+    if not ids:
+	return {}
+
+    fd, ids_filename = tempfile.mkstemp(prefix="releasify-")
+    os.write(fd, ''.join(["%s\n" % x for x in ids]))
+    os.close(fd)
+
+    cmd = "git cat-file --batch < %s" % ids_filename
+    retries = config["retries"]
+    try:
+	while True:
+	    blobs = {}
+	    f = os.popen(cmd)
+	    while True:
+		header = f.readline().split()
+		if len(header) != 3:
+		    break
+		blobs[header[0]] = f.read(int(header[2]))
+		f.read(1)
+	    rc = f.close()
+	    if not rc and len(blobs) == len(ids):
+		return blobs
+	    if retries > 0:
+		retries -= 1
+		sys.stderr.write('Retrying "%s"\n' % cmd)
+		time.sleep(1)
+		continue
+	    raise Exception('%s returned %d\n' % (cmd, rc or 1))
+    finally:
+	os.remove(ids_filename)
+
+
+def remove_file(output_dir, path):
+    filename = os.path.join(output_dir, path)
+    if os.path.islink(filename) or os.path.exists(filename):
+	os.remove(filename)
+
+    # remove the directories left empty
+    dirname = os.path.dirname(path)
+    while dirname:
+	dirpath = os.path.join(output_dir, dirname)
+	if not os.path.isdir(dirpath) or os.listdir(dirpath):
+	    break
+	os.rmdir(dirpath)
+	dirname = os.path.dirname(dirname)
+
+
+def write_file(output_dir, path, mode, contents):
+    filename = os.path.join(output_dir, path)
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+	os.makedirs(dirname)
+    if os.path.islink(filename) or os.path.exists(filename):
+	os.remove(filename)
+
+    if mode == '120000':
+	os.symlink(contents, filename)
+	return
+
+    file = open(filename, "wb")
+    file.write(contents)
+    file.close()
+    if mode == '100755':
+	os.chmod(filename, 0755)
+    else:
+	os.chmod(filename, 0644)
+
+
 def create_patches():
     """
     Create a patch in config["output_dir"]/recipes/linux/patches for
@@ -331,7 +665,6 @@ def create_patches():
 	return
 
     patch_dir = os.path.join(output_dir, "recipes/linux/patches")
-    re_patch_dir = re.compile("%s/" % patch_dir)
 
     if not os.path.isdir(patch_dir):
 	try:
@@ -340,6 +673,38 @@ def create_patches():
 	    sys.stderr.write("failed: mkdir %s\n" % patch_dir)
 	    sys.exit(1)
 
+    # Only the commits whose patches aren't in the cache are formatted,
+    # in runs of consecutive commits
+    cache = config["cache"]
+    numbers = {}
+    runs = []
+    for commits in consecutive_groups:
+	run = []
+	for commit in commits:
+	    numbers[commit.id] = len(numbers) + 1
+	    if cache.has(commit.id):
+		if run:
+		    runs.append(run)
+		    run = []
+	    else:
+		run.append(commit)
+	if run:
+	    runs.append(run)
+
+    if runs:
+	make_patches(runs, patch_dir, numbers, cache)
+
+    patchnames = []
+    index = 1
+    for commits in consecutive_groups:
+	for commit in commits:
+	    patchname = "%04d-%s" % (index, cache.names[commit.id])
+	    path = os.path.join(patch_dir, patchname)
+	    if cache.paths[commit.id] != path:
+		shutil.copyfile(cache.paths[commit.id], path)
+	    patchnames.append(patchname)
+	    index += 1
+
     series_filename = os.path.join(patch_dir, "series")
 
     try:
@@ -348,23 +713,20 @@ def create_patches():
 	sys.stderr.write("open for writing failed: %s\n" % series_filename)
 	sys.exit(1)
 
-    index = 1
-    for commits in consecutive_groups:
-	cmd = "git format-patch -o %s -%s --start-number %d -N %s" % (
-		patch_dir, len(commits), index, commits[-1].id)
-	patchnames = call(cmd).splitlines()
-	patchnames = [re_patch_dir.sub('', x) for x in patchnames]
-	for patchname in patchnames:
-	    series_file.write("%s\n" % patchname)
-	index += len(commits)
-
+    for patchname in patchnames:
+	series_file.write("%s\n" % patchname)
     series_file.close()
 
+    cache.prune(numbers, cache_max_age)
+
 
 def copy_metadata():
     """
     Copy the directory hierarchy from the MONTAVISTA/bitbake
     directory in config["committish"] to config["output_dir"].
+
+    Only the files that differ from those written by the previous copy,
+    as listed in the output directory's manifest, are written or removed.
     """
 
     committish = config["committish"]
@@ -374,7 +736,7 @@ def copy_metadata():
     bitbake_dir_ref = "%s:%s" % (committish, bitbake_dir)
 
     try:
-	call("git rev-parse %s" % bitbake_dir_ref)
+	tree = call("git rev-parse %s" % bitbake_dir_ref).strip()
     except:
 	sys.stderr.write("Directory %s not found in %s\n" %
 			    (bitbake_dir, committish))
@@ -383,32 +745,50 @@ def copy_metadata():
     if config["dry-run"]:
 	return
 
-    retries = config["retries"]
-    cmd = 'git archive %s' % bitbake_dir_ref
-    retrying = True
-    while retrying:
-	retrying = False
-
-	f = os.popen(cmd)
+    manifest = Manifest(output_dir)
+    entries = tree_entries(tree)
+    old_entries = manifest.entries
+
+    if manifest.tree == tree and not manifest.pending:
+	paths = []
+    else:
+	paths = [x for x in entries if entries[x] != old_entries.get(x)]
+	paths += [x for x in old_entries if x not in entries]
+
+	# the paths that an incomplete sync may have changed
+	if manifest.pending:
+	    try:
+		pending_entries = tree_entries(manifest.pending)
+	    except:
+		pending_entries = {}
+		paths += old_entries.keys()
+	    paths += [x for x in pending_entries
+		      if pending_entries[x] != old_entries.get(x)]
+
+    # files removed from the output since they were written
+    for path in entries:
+	if not os.path.lexists(os.path.join(output_dir, path)):
+	    paths.append(path)
+
+    paths = dict.fromkeys(paths).keys()
+    if not paths:
+	return
 
-	tar = tarfile.open(fileobj=f, mode='r|')
-	file = tar.next() # too bad we can't use extractall(), from python 2.5
-	while file:
-	    tar.extract(file, path=output_dir)
-	    file = tar.next()
-	tar.close()
+    manifest.write(manifest.tree or tree, old_entries, pending=tree)
 
-	git_exit_code = f.close()
+    ids = dict.fromkeys([entries[x][1] for x in paths if x in entries]).keys()
+    blobs = read_blobs(ids)
 
-	if git_exit_code:
-	    if retries > 0:
-		retrying = True
-		retries -= 1
-		sys.stderr.write('Retrying "%s"\n' % cmd)
-		time.sleep(1)
-		continue
+    paths.sort()
+    for path in paths:
+	if path not in entries:
+	    remove_file(output_dir, path)
+    for path in paths:
+	if path in entries:
+	    mode, id = entries[path]
+	    write_file(output_dir, path, mode, blobs[id])
 
-	    raise Exception('%s returned %d\n' % (cmd, git_exit_code))
+    manifest.write(tree, entries)
 
 
 def main():
@@ -251,6 +251,7 @@ def provenance():
 
 
 def main():
+    git.run_in_daemon()
     process_options()
 
     try:
@@ -270,4 +271,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
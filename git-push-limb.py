@@ -9,21 +9,29 @@ Push each branch in <local-limb> into <remote_limb> on
 For each branch, branch_name, in <local_limb>, git-push-limb runs
 "git push <remote_repository> [<local_limb>/]branch_name:[<remote_limb>/]branch_name".
 If neither <local_limb> and <remote_limb> are supplied, push the current
-limb.  If only :<remote_limb> is supplied, then first run "git fetch
-<remote_repository>" to update remote references, and then delete
-<remote_limb> from <remote_repository>.
+limb.  If only :<remote_limb> is supplied, then delete <remote_limb> from
+<remote_repository>.
+
+Before deleting, or pushing unless -n is given, the remote references of
+<remote_limb>, and of its parent limb if it is a bugfixes limb, are first
+updated as by "git fetch-limb <remote_repository> <remote_limb>".
+
+Unless -n is given, the changes are then shown as by "git analyze-changes",
+and, when run from a terminal, the push is confirmed unless -y is given.
+Branches that would not fast-forward, or that do not contain the parent
+limb's branches, are not pushed unless -f is given.
 """
 
 import sys
 import getopt
 import re
-import time
 import mvgitlib as git
 
 
 config = {
     "debug"		: False,
     "nofetch"		: False,
+    "yes"		: False,
     'options'           : [],
 }
 
@@ -41,10 +49,10 @@ def usage(msg=None):
 
 
 def process_options():
-    short_opts = "fhn"
+    short_opts = "fhny"
     long_opts = [
 	"help", "debug", "dry-run", "tags", "force", "thin", "no-thin",
-	"no-fetch", "version",
+	"no-fetch", "version", "yes",
     ]
 
     try:
@@ -63,6 +71,8 @@ def process_options():
 	    sys.exit(0)
 	elif option == "-n" or option == "--no-fetch":
 	    config["nofetch"] = True
+	elif option == "-y" or option == "--yes":
+	    config["yes"] = True
 	elif value:
 	    if option.startswith("--"):
 		config["options"].append("%s=%s" % (option, value))
@@ -94,6 +104,51 @@ def process_options():
     config["remote"] = remote
 
 
+def analyze_limb(repo, remotename, localname):
+    '''
+    Show the changes that pushing localname to remotename would make
+
+    git-analyze-changes runs in this process and leaves its comparisons
+    of the limbs for compared_limb() to reuse.
+    '''
+    args = ['-r', repo, '%s/%s..%s' % (repo, remotename, localname)]
+    sys.stdout.write('-> git analyze-changes %s\n' % ' '.join(args))
+    if git.run_command('analyze-changes', args, keep_refs=True):
+	sys.stderr.write("git analyze-changes failed.  No branches pushed.\n")
+	sys.exit(1)
+
+
+def compared_limb(repo, remotename, local):
+    '''
+    Return the limb remotename in repo, compared with the limb local
+    '''
+    name = "%s/%s" % (repo, remotename)
+    limb = git.Limb.limb_dict.get(name)
+    if not limb or limb.newlimb != local:
+	limb = git.Limb(name, local.name)
+    return limb
+
+
+def confirm(question):
+    '''
+    Ask question on the terminal, returning True if the answer is yes
+    '''
+    if config["yes"] or not sys.stdin.isatty():
+	return True
+
+    while True:
+	sys.stdout.write("%s [y/n] " % question)
+	sys.stdout.flush()
+	answer = sys.stdin.readline()
+	if not answer:
+	    return False
+	answer = answer.strip().lower()
+	if answer in ('y', 'yes'):
+	    return True
+	if answer in ('n', 'no'):
+	    return False
+
+
 def push_limb():
     re_parent = re.compile(r'(.*)/bugfixes/\d+[^/]*')
 
@@ -109,8 +164,7 @@ def push_limb():
         remotename = localname
 
     if not localname or not nofetch:
-	git.call(['git', 'fetch', repo], stdout=sys.stdout, verbose=True)
-	git.call(['git', 'remote', 'prune', repo], stdout=sys.stdout, verbose=True)
+	git.fetch_limbs(repo, [remotename])
 
     if not localname:
         remote_branchnames = git.branchnames("%s/%s" % (repo, remotename))
@@ -130,43 +184,32 @@ def push_limb():
 	sys.exit(1)
 
     if not nofetch:
-	# call "git analyze-changes" before pushing
-	cmd = ['git', 'analyze-changes', '-r', repo]
-	if local != git.current_limb():
-	    cmd.append(localname)
-	try:
-	    git.call(cmd, stdout=sys.stdout, verbose=True)
-	except:
-	    sys.stderr.write("git analyze-changes failed.  No branches pushed.\n")
-	    sys.exit(1)
-	time.sleep(5)
+	analyze_limb(repo, remotename, localname)
 
-    local_subnames = git.subnames(localname)
+    limb = compared_limb(repo, remotename, local)
+    parent = None
+    match = re_parent.match(remotename)
+    if match:
+	parentname = "%s/%s" % (repo, match.group(1))
+	parent = compared_limb(repo, match.group(1), local)
+	parent.branch_status_dict
+	parent_branches = dict([(x.subname, x) for x in parent.branches])
 
     nff_names = []
     rebased_names = []
     branchnames = []
-    for subname in local_subnames:
-        branchname = "%s/%s" % (localname, subname)
-	repo_branchname = "%s/%s/%s" % (repo, remotename, subname)
-
-	repo_branch= git.Branch.get(repo_branchname)
-	branch = git.Branch.get(branchname)
-
-	if repo_branch.id and repo_branch.id == branch.id:
-	    continue
-
-	rebased = False
-	match = re_parent.match(remotename)
-	if match:
-	    parentname = match.group(1)
-	    parent_branchname = "%s/%s/%s" % (repo, parentname, subname)
-	    parent_branch = git.Branch.get(parent_branchname)
-	    rebased = parent_branch.id and not branch.contains(parent_branch)
-
-	if rebased:
-	    rebased_names.append(branchname)
-	elif repo_branch.id and not branch.contains(repo_branch):
+    branches = limb.created_branches + limb.changed_branches
+    branches.sort(key=lambda x: x.subname)
+    for branch in branches:
+	subname = branch.subname
+	branchname = branch.newbranch.name
+
+	if parent:
+	    parent_branch = parent_branches[subname]
+	    if parent_branch.id and not parent_branch.fast_forward:
+		rebased_names.append(branchname)
+	if branch.id and not branch.fast_forward and \
+		branchname not in rebased_names:
 	    nff_names.append(branchname)
 
         if localname != remotename:
@@ -176,7 +219,6 @@ def push_limb():
 
     force = "-f" in options or "--force" in options
     if rebased_names and not force:
-	parentname = "%s/%s" % (repo, parentname)
 	sys.stdout.write("\nNon-fast-forward when compared to %s:\n" %
 		parentname)
 	for branchname in rebased_names:
@@ -200,6 +242,11 @@ def push_limb():
 	sys.stdout.write("No updated or new branches to push.\n")
 	return
 
+    if not nofetch and not confirm("Push %d branch%s to %s?" %
+	    (len(branchnames), ("es", "")[len(branchnames) == 1], repo)):
+	sys.stdout.write("\nNo branches pushed.\n")
+	return
+
     cmd = ['git', 'push'] + options + [repo] + branchnames
     git.call(cmd, stdout=sys.stdout, verbose=True)
 
@@ -224,4 +271,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
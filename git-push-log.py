@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+Usage: git-push-log [-t <time>] <limb>
+       git-push-log [-s <time>] [-u <time>] -b <branch>
+       git-push-log --import <limb>...
+       git-push-log --reindex <limb>...
+
+Queries the push history that the server's pre-receive hook keeps
+for each limb, in limblogs/ in the git directory.
+
+With a <limb>, lists the id of each of the limb's branches as the
+latest push at or before <time>, the latest push by default, left it.
+
+With -b, lists each push that updated <branch>, with the branch's old
+and new ids.  A zero id stands for a branch that didn't exist.
+
+Times are in UTC, as "YYYY-MM-DD", "YYYY-MM-DD HH:MM[:SS]", or as
+seconds since the epoch.
+
+	-t <time>	List the limb's branches as of <time>
+	-b <branch>	List the pushes that updated <branch>
+	-s <time>	List only the pushes at or after <time>
+	-u <time>	List only the pushes at or before <time>
+	--import	Add the pushes recorded in each limb's old-style
+			limblogs/<limb>.log ahead of those in the limb's
+			push history
+	--reindex	Rebuild the indexes of each limb's push history
+			from its records
+"""
+
+import sys
+import os
+import getopt
+import time
+import calendar
+import mvgitlib as git
+
+
+config = {
+    "debug"		: False,
+    "time"		: None,
+    "branch"		: None,
+    "since"		: None,
+    "until"		: None,
+    "import"		: False,
+    "reindex"		: False,
+}
+
+time_formats = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def parse_time(value):
+    '''
+    Return the seconds since the epoch of a time given in UTC
+    '''
+    if value.isdigit():
+	return int(value)
+    for format in time_formats:
+	try:
+	    return calendar.timegm(time.strptime(value, format))
+	except ValueError:
+	    pass
+    usage('Invalid time: %s' % value)
+
+
+def process_options():
+    short_opts = "b:hs:t:u:"
+    long_opts = ["help", "debug", "version", "import", "reindex"]
+
+    try:
+	options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+
+    except getopt.GetoptError, err:
+	usage(err)
+
+    for option, value in options:
+	if option == "--help" or option == "-h":
+	    usage()
+	elif option == "--debug":
+	    config["debug"] = True
+	elif option == '--version':
+	    sys.stdout.write('mvgit version %s\n' % "@@MVGIT_VERSION@@")
+	    sys.exit(0)
+	elif option == "-t":
+	    config["time"] = parse_time(value)
+	elif option == "-b":
+	    config["branch"] = value
+	elif option == "-s":
+	    config["since"] = parse_time(value)
+	elif option == "-u":
+	    config["until"] = parse_time(value)
+	elif option == "--import":
+	    config["import"] = True
+	elif option == "--reindex":
+	    config["reindex"] = True
+
+    if config["import"] or config["reindex"]:
+	if not args:
+	    usage()
+    elif config["branch"]:
+	if args:
+	    usage()
+    elif len(args) != 1:
+	usage()
+
+    config["limbs"] = [x.strip('/') for x in args]
+
+
+def format_time(pushtime):
+    return '%s UTC' % time.asctime(time.gmtime(pushtime))
+
+
+def read_old_log(filename):
+    '''
+    Return the (time, branches) of each push recorded in an old-style
+    limb log, with branches as for PushLog.append()
+    '''
+    pushes = []
+    branches = None
+    for line in open(filename):
+	line = line.strip()
+	if not line:
+	    branches = None
+	elif branches is None:
+	    pushtime = calendar.timegm(time.strptime(line[:-len(' UTC')]))
+	    branches = []
+	    pushes.append((pushtime, branches))
+	else:
+	    words = line.split()
+	    if len(words) == 2:
+		words.append(None)
+	    branches.append(tuple(words))
+    return pushes
+
+
+def import_log(limbname):
+    log = git.PushLog(limbname)
+    filename = os.path.join(git.git_dir(), 'limblogs', '%s.log' % limbname)
+    if not os.path.isfile(filename):
+	raise git.GitError('%s not found' % filename)
+
+    pushes = read_old_log(filename)
+    if not pushes:
+	sys.stdout.write('No pushes to import to %s\n' % limbname)
+	return
+
+    # the hook stopped adding to the old log when the history began
+    first_time = log.first_time()
+    if first_time is not None and first_time <= pushes[-1][0]:
+	raise git.GitError('The push history of %s already has the pushes '
+			   'in %s' % (limbname, filename))
+
+    log.prepend(pushes)
+    sys.stdout.write('Imported %d pushes to %s\n' % (len(pushes), limbname))
+
+
+def list_limb(limbname):
+    log = git.PushLog(limbname)
+    if not log.exists():
+	raise git.GitError('No push history for %s' % limbname)
+
+    pushtime, ids = log.state(config["time"])
+    if pushtime is None:
+	raise git.GitError('No push to %s by then' % limbname)
+
+    sys.stdout.write('%s\n' % format_time(pushtime))
+    subnames = ids.keys()
+    subnames.sort()
+    for subname in subnames:
+	sys.stdout.write('%s %s\n' % (subname, ids[subname]))
+
+
+def list_branch(branchname):
+    limbname = os.path.dirname(branchname)
+    log = git.PushLog(limbname)
+    if not log.exists():
+	raise git.GitError('No push history for %s' % limbname)
+
+    moves = log.moves(os.path.basename(branchname),
+		      config["since"], config["until"])
+    for pushtime, old, new in moves:
+	sys.stdout.write('%s %s %s\n' % (format_time(pushtime), old, new))
+
+
+def push_log():
+    if config["import"]:
+	for limbname in config["limbs"]:
+	    import_log(limbname)
+    elif config["reindex"]:
+	for limbname in config["limbs"]:
+	    log = git.PushLog(limbname)
+	    if not log.exists():
+		raise git.GitError('No push history for %s' % limbname)
+	    log.reindex()
+    elif config["branch"]:
+	list_branch(config["branch"].strip('/'))
+    else:
+	list_limb(config["limbs"][0])
+
+
+def main():
+    process_options()
+
+    try:
+	git.check_repository()
+
+	push_log()
+
+    except git.GitError, e:
+	sys.stderr.write("\nError: %s\n" % e.msg)
+	sys.stderr.write("Exiting.\n")
+
+	if config["debug"]:
+	    sys.stdout.write("\n")
+	    raise
+
+	sys.exit(1)
+
+
+git.run_main(main)
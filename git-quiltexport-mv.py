@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""
+Usage: git-quiltexport-mv [--append] [--patchprefix <prefix>]
+			  [--seriesfile <filename>] [--startnumber <num>]
+			  [--outputdir <dir>] [--jobs <n>] <rev>
+
+Exports the commits from <rev> to HEAD as a quilt series: a patch file
+for each commit, as made by "git format-patch", and a series file
+listing them, in <dir>, /tmp/patches by default.  Dashes in the patch
+names are replaced by underscores, and the patch numbers are dropped
+unless --startnumber is given.
+
+With --append, the patches are appended to the series file, and the
+leading patches that are already in it, made from the same commits,
+are not written again.  The new patches are numbered as part of the
+whole series.
+"""
+
+import sys
+import os
+import re
+import getopt
+import subprocess
+import threading
+import Queue
+import mvgitlib as git
+
+
+config = {
+    "debug"		: False,
+    "outputdir"		: "/tmp/patches",
+    "seriesfile"	: "series",
+    "patchprefix"	: "",
+    "append"		: False,
+    "startnumber"	: 1,
+    "numbered"		: False,
+    "jobs"		: 4,
+}
+
+# git format-patch's limit on the length of a patch name
+patch_name_max = 64
+patch_suffix = '.patch'
+
+re_email_from = re.compile(r'From ([0-9a-f]{40}) Mon Sep 17 00:00:00 2001$')
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def process_options():
+    short_opts = "h"
+    long_opts = ["help", "debug", "version", "outputdir=", "seriesfile=",
+		 "patchprefix=", "append", "startnumber=", "jobs="]
+
+    try:
+	options, args = getopt.getopt(sys.argv[1:], short_opts, long_opts)
+
+    except getopt.GetoptError, err:
+	usage(err)
+
+    for option, value in options:
+	if option == "--help" or option == "-h":
+	    usage()
+	elif option == "--debug":
+	    config["debug"] = True
+	elif option == '--version':
+	    sys.stdout.write('mvgit version %s\n' % "@@MVGIT_VERSION@@")
+	    sys.exit(0)
+	elif option == "--outputdir":
+	    config["outputdir"] = value
+	elif option == "--seriesfile":
+	    config["seriesfile"] = value
+	elif option == "--patchprefix":
+	    config["patchprefix"] = value
+	elif option == "--append":
+	    config["append"] = True
+	elif option == "--startnumber":
+	    try:
+		config["startnumber"] = int(value)
+	    except ValueError:
+		usage("--startnumber requires a number")
+	    config["numbered"] = True
+	elif option == "--jobs":
+	    try:
+		config["jobs"] = max(1, int(value))
+	    except ValueError:
+		usage("--jobs requires a number")
+
+    if len(args) != 1:
+	usage()
+
+    config["rev"] = args[0]
+
+
+class Patch(object):
+    '''
+    A commit to export, and the name of its patch in the series
+    '''
+
+    def __init__(self, id, number, subject):
+	self.id = id
+	self.number = number
+
+	# as named by "git format-patch"
+	name = '%04d-%s' % (number, subject)
+	name = name[:patch_name_max - len(patch_suffix) - 1] + patch_suffix
+
+	name = name.replace('-', '_')
+	if not config["numbered"]:
+	    name = re.sub(r'^[0-9]{4}_', '', name)
+	self.name = config["patchprefix"] + name
+
+
+def read_patches(rev):
+    '''
+    Return a Patch for each commit from rev to HEAD, oldest first
+    '''
+    cmd = ['git', 'log', '--reverse', '--format=%H %P%n%f', '%s..HEAD' % rev]
+    lines = git.call(cmd).splitlines()
+
+    patches = []
+    number = config["startnumber"]
+    for i in range(0, len(lines), 2):
+	ids = lines[i].split()
+	if len(ids) > 2:
+	    sys.stdout.write("The revisions you have selected to export "
+			     "contain merges\n")
+	    sys.stdout.write("Please linearize the history before exporting "
+			     "to quilt\n")
+	    sys.exit(1)
+	patches.append(Patch(ids[0], number, lines[i + 1]))
+	number += 1
+
+    return patches
+
+
+class PatchWriter(object):
+    '''
+    Writes patch files with a pool of threads
+
+    Each file is written to a temporary name and renamed into place,
+    so a patch file is either complete or absent.
+    '''
+
+    def __init__(self, directory, jobs):
+	self.directory = directory
+	self.queue = Queue.Queue(jobs * 4)
+	self.errors = []
+	self.threads = []
+	for i in range(jobs):
+	    thread = threading.Thread(target=self.run)
+	    thread.setDaemon(True)
+	    thread.start()
+	    self.threads.append(thread)
+
+
+    def run(self):
+	while True:
+	    item = self.queue.get()
+	    if not item:
+		return
+	    name, contents = item
+	    try:
+		path = os.path.join(self.directory, name)
+		tmp_path = os.path.join(self.directory, '.%s.tmp' % name)
+		file = open(tmp_path, 'w')
+		file.write(contents)
+		file.close()
+		os.rename(tmp_path, path)
+	    except (IOError, OSError), e:
+		self.errors.append('%s: %s' % (name, e))
+
+
+    def write(self, name, contents):
+	self.queue.put((name, contents))
+
+
+    def close(self):
+	for thread in self.threads:
+	    self.queue.put(None)
+	for thread in self.threads:
+	    thread.join()
+	if self.errors:
+	    raise git.GitError('writing patches failed:\n%s' %
+			       '\n'.join(self.errors))
+
+
+def format_patches(patches, base, numbered, writer):
+    '''
+    Write the patches of the commits from base to HEAD, which are
+    those of patches, from a single "git format-patch --stdout"
+
+    If numbered is True, the subjects are numbered even if there is
+    only one patch, counting from the first patch's number to the
+    total of the series.
+    '''
+    first = patches[0]
+    cmd = ['git', 'format-patch', '--stdout', '--start-number',
+	   str(first.number)]
+    if numbered:
+	cmd.append('--numbered')
+    cmd.append('%s..HEAD' % base)
+    process = git.Popen(cmd, stdout=subprocess.PIPE)
+
+    index = {}
+    for i in range(len(patches)):
+	index[patches[i].id] = i
+
+    # Each patch starts with a "From <id> <date>" line for a later
+    # commit, which also tells it apart from lines in a commit message.
+    # Patches are separated by a blank line.  Empty commits have no
+    # patch in the stream, but get an empty file, as format-patch
+    # makes without --stdout.
+    i = -1
+    lines = []
+    for line in process.stdout:
+	match = re_email_from.match(line.rstrip('\n'))
+	if match and index.get(match.group(1), -1) > i:
+	    if lines:
+		if lines[-1] == '\n':
+		    del lines[-1]
+		writer.write(patches[i].name, ''.join(lines))
+	    for empty in patches[i + 1:index[match.group(1)]]:
+		writer.write(empty.name, '')
+	    i = index[match.group(1)]
+	    lines = []
+	lines.append(line)
+    if lines and i >= 0:
+	writer.write(patches[i].name, ''.join(lines))
+    for empty in patches[i + 1:]:
+	writer.write(empty.name, '')
+
+    if process.wait() != 0:
+	raise git.GitError('%s failed' % ' '.join(cmd))
+
+
+def patch_commit_id(path):
+    '''
+    Return the id of the commit whose patch is in the file at path,
+    or None
+    '''
+    try:
+	line = open(path).readline()
+    except IOError:
+	return None
+    match = re_email_from.match(line.rstrip('\n'))
+    return match and match.group(1)
+
+
+def read_series(path):
+    if not os.path.isfile(path):
+	return []
+    return [x.strip() for x in open(path) if x.strip()]
+
+
+def write_series(path, names):
+    tmp_path = '%s.tmp.%d' % (path, os.getpid())
+    file = open(tmp_path, 'w')
+    for name in names:
+	file.write('%s\n' % name)
+    file.close()
+    os.rename(tmp_path, path)
+
+
+def quiltexport():
+    outputdir = config["outputdir"]
+    rev = config["rev"]
+
+    if not git.commit_id(rev):
+	sys.exit(1)
+
+    if os.path.isfile(outputdir):
+	raise git.GitError('%s exists and is a regular file' % outputdir)
+    if not os.path.isdir(outputdir):
+	try:
+	    os.makedirs(outputdir)
+	except OSError:
+	    raise git.GitError('Could not create %s' % outputdir)
+    if not os.access(outputdir, os.W_OK):
+	raise git.GitError('%s is not writeable' % outputdir)
+
+    patches = read_patches(rev)
+
+    series_path = os.path.join(outputdir, config["seriesfile"])
+    series = []
+    if config["append"]:
+	series = read_series(series_path)
+
+    # In append mode, skip the leading patches that are already exported,
+    # for the same commits
+    present = dict.fromkeys(series)
+    skipped = 0
+    for patch in patches:
+	if (patch.name not in present or
+		patch_commit_id(os.path.join(outputdir, patch.name)) !=
+		patch.id):
+	    break
+	skipped += 1
+
+    new_patches = patches[skipped:]
+    if new_patches:
+	if skipped:
+	    base = patches[skipped - 1].id
+	else:
+	    base = rev
+	# number the new patches as part of the whole series, as they
+	# would be without the skipped ones
+	numbered = len(patches) > 1
+	writer = PatchWriter(outputdir, config["jobs"])
+	try:
+	    format_patches(new_patches, base, numbered, writer)
+	finally:
+	    writer.close()
+
+    names = [x.name for x in new_patches if x.name not in present]
+    if config["append"]:
+	names = series + names
+    write_series(series_path, names)
+
+
+def main():
+    process_options()
+
+    try:
+	git.check_repository()
+	os.chdir(git.call(['git', 'rev-parse', '--show-toplevel']).rstrip('\n'))
+
+	quiltexport()
+
+    except git.GitError, e:
+	sys.stderr.write("\nError: %s\n" % e.msg)
+	sys.stderr.write("Exiting.\n")
+
+	if config["debug"]:
+	    sys.stdout.write("\n")
+	    raise
+
+	sys.exit(1)
+
+
+git.run_main(main)
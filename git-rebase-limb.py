@@ -171,4 +171,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
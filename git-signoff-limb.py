@@ -159,4 +159,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
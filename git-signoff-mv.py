@@ -327,10 +327,10 @@ sys.stdout.writelines(lines)
     if config["force"]:
 	cmd.append("-f")
     cmd.append(revlist)
-    rc = subprocess.call(cmd)
+    rc = git.Popen(cmd).wait()
 
     cmd = ['git', 'rev-parse', '--git-dir']
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    p = git.Popen(cmd, stdout=subprocess.PIPE)
     gitdir = p.stdout.read().rstrip()
     rc = p.wait()
     original = gitdir + "/refs/original"
@@ -357,4 +357,4 @@ def main():
 	sys.exit(1)
 
 
-main()
+git.run_main(main)
@@ -220,12 +220,7 @@ def pre_receive(tags, branches):
 	    limbs.append(limb)
 
     for limb in limbs:
-	filename = os.path.join('limblogs', '%s.log' % limb.name)
-	dirname = os.path.dirname(filename)
-	if not os.path.isdir(dirname):
-	    os.makedirs(dirname)
-	file = open(filename, 'a')
-	limb.write_push_log_entry(file)
+	limb.write_push_log_entry()
 
 
 def notice(msg):
@@ -579,18 +574,17 @@ def set_global_constants():
 	'''
 	Return the value of the given git config variable
 	'''
-	try:
-	    val = git.call(['git', 'config', var]).strip()
-	    if array:
-		val = [x.strip() for x in val.split(',')]
-	except:
+	val = git.config().get(var)
+	if val is None:
 	    if required:
 		error('"Server missing config variable %s"\n' % var)
 	    if array:
-		val = []
-	    else:
-		val = ''
+		return []
+	    return ''
 
+	val = val.strip()
+	if array:
+	    val = [x.strip() for x in val.split(',')]
 	return val
 
 
@@ -662,4 +656,4 @@ def main():
     do_refs()
 
 
-main()
+git.run_main(main, profile_config="mvista.profile")
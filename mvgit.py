@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Usage: mvgit [--trace[=<file>]] <command> [<args>] [\\; <command> [<args>]]...
+       mvgit --list
+
+Runs the mvgit command git-<command> with the given arguments.
+Several commands, separated by ";" arguments, are run in sequence
+until one of them fails.  The commands run in a single process and
+share their caches, so later commands don't read again what earlier
+commands have read.
+
+	--list		List the available commands
+	--trace		Report the git processes run, and their durations,
+			and write a JSON record of each to <file>
+"""
+
+import sys
+import mvgitlib as git
+
+
+config = {
+    "debug"		: False,
+    "list"		: False,
+}
+
+
+def usage(msg=None):
+    """
+    Print a usage message and exit with an error code
+    """
+
+    if msg:
+	sys.stderr.write("%s\n" % str(msg).rstrip())
+
+    sys.stderr.write("\n%s\n" % __doc__.strip())
+    sys.exit(1)
+
+
+def process_options():
+    args = sys.argv[1:]
+
+    # Options after the first command name belong to the commands
+    while args and args[0].startswith('-'):
+	option = args.pop(0)
+	if option == "--help" or option == "-h":
+	    usage()
+	elif option == "--debug":
+	    config["debug"] = True
+	elif option == '--version':
+	    sys.stdout.write('mvgit version %s\n' % "@@MVGIT_VERSION@@")
+	    sys.exit(0)
+	elif option == "--list":
+	    config["list"] = True
+	elif option == "--trace":
+	    git.enable_tracing()
+	elif option.startswith("--trace="):
+	    git.enable_tracing(option[len("--trace="):])
+	else:
+	    usage('unknown option: %s' % option)
+
+    commands = [[]]
+    for arg in args:
+	if arg == ';':
+	    commands.append([])
+	else:
+	    commands[-1].append(arg)
+    commands = [x for x in commands if x]
+
+    if not commands and not config["list"]:
+	usage()
+
+    config["commands"] = commands
+
+
+def mvgit():
+    if config["list"]:
+	for name in git.command_names():
+	    sys.stdout.write('%s\n' % name)
+	return
+
+    for command in config["commands"]:
+	status = git.run_command(command[0], command[1:])
+	if status:
+	    sys.exit(status)
+
+
+def main():
+    process_options()
+
+    try:
+	mvgit()
+
+    except git.GitError, e:
+	sys.stderr.write("\nError: %s\n" % e.msg)
+	sys.stderr.write("Exiting.\n")
+
+	if config["debug"]:
+	    sys.stdout.write("\n")
+	    raise
+
+	sys.exit(1)
+
+
+git.run_main(main)
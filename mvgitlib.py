@@ -21,11 +21,32 @@ import pwd
 import grp
 import time
 import tempfile
+import atexit
+import socket
+import select
+import fcntl
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+re_commit_id = re.compile(r'[0-9a-f]{40}$')
+contains_cache = {}
 
 def commit_contains(container, contained):
     """Return True if the commit container contains the commit contained"""
+
+    # Only results for full commit ids can be remembered, names may move
+    key = (container, contained)
+    if key in contains_cache:
+	return contains_cache[key]
+
     cmd = ['git', 'rev-list', '-1', contained, '^%s' % container]
-    return not bool(call(cmd, stderr=None))
+    result = not bool(call(cmd, stderr=None))
+    if re_commit_id.match(container) and re_commit_id.match(contained):
+	contains_cache[key] = result
+    return result
 
 class GitError(Exception):
     def __init__(self, msg):
@@ -196,14 +217,12 @@ class Limb(object):
 
 	    for b in branches:
 		ref = '%s:%s' % (b.id, self.upstream_version_filename)
-		cmd = ['git', 'show', ref]
-		version = call(cmd, error=None, stderr=None)
+		version = metadata_cache().value('upstream_version', b.id,
+				self.upstream_version_filename, first_line)
 		if version:
-		    version = version.strip()
-		    version = re.sub('\n.*', '', version)
 		    version = 'v%s' % version
 		    cmd = ['git', 'rev-parse', version]
-		    if bool(call(cmd, stderr=None)):
+		    if object_exists(version) or call(cmd, stderr=None):
 			return version
 
 		    sys.stderr.write('Warning: Unknown version "%s" in %s\n' %
@@ -270,38 +289,28 @@ class Limb(object):
 
 
     @cached_property
-    def dependent_branches(self):
+    def repository_branch_set(self):
 	'''
-	Find, read and parse the limb's branch_dependencies file.
-	Return the limb's dependent branches.  Also, put branch
-	flags, provider branches, and branch provider flags into
-	branch.set_by_limb.
+	Return the set of the limb's repository branches, for fast lookups
 	'''
+	return set(self.repository_branches)
 
-	dep_filename = self.branch_dep_filename
-	for limb in (self,
-		     self.remote_limb,
-		     self.parent and self.parent.remote_limb):
-	    if not limb:
-		continue
-	    info_branch = limb.info_branch
-	    dep_ref = '%s:%s' % (info_branch.id, dep_filename)
 
-	    try:
-		# read branch_dependencies file
-		cmd = ['git', 'show', dep_ref]
-		dep_lines = call(cmd, stderr=None).splitlines()
-		break
-	    except:
-		pass
-	else:
-	    dep_lines = []
+    def parse_dependencies(self, contents, dep_ref):
+	'''
+	Parse the contents of a branch_dependencies file
 
-	# parse branch dependencies
-	arr = None
+	Returns a list with a (subname, flags, providers) tuple for each
+	dependent branch, where providers is a list of (name, flags)
+	tuples.  Names are returned as written in the file, so the
+	result doesn't depend on the limb or the remote and may be
+	cached by the file's blob id.
+	'''
+
+	dependencies = []
+	providers = None
 	expect_provider = False
-	dependent_branches = []
-	for orig_line in dep_lines:
+	for orig_line in contents.splitlines():
 	    line = orig_line
 
 	    comment_index = line.find('#')
@@ -317,65 +326,95 @@ class Limb(object):
 	    if expect_provider:
 		m = self.re_provider.search(line)
 		if m:
-		    branchname = m.group(1)
-		    if branchname.startswith('/'):
-			remote = remote_alias()
-			if remote:
-			    branchname = remote + branchname
-			else:
-			    branchname = branchname[1:]
-		    else:
-			branchname = '%s/%s' % (self.name, branchname)
-		    branch = Branch.get(branchname)
-		    if not branch.id:
-			if branch.remote_branch and branch.remote_branch.id:
-			    branch = branch.remote_branch
-
-		    provider_flags = m.group(2).split()
-		    for flag in provider_flags:
-			if flag not in branch.valid_provider_flags:
-			    sys.stderr.write('branch_dependencies: '
-				'Invalid flag "%s" for provider %s of '
-				'dependent branch %s\n' %
-				(flag, branch.name, dependent_branch.name))
-			    sys.exit(1)
-		    set_by_limb = dependent_branch.set_by_limb
-		    set_by_limb['provider_flags'][branch] = provider_flags
-
-		    arr.append(branch)
+		    providers.append((m.group(1), tuple(m.group(2).split())))
 		    continue
 
 	    m = self.re_dependent.search(line)
 	    if m:
-		arr = []
-		branchname = '%s/%s' % (self.name, m.group(1))
-		branch = Branch.get(branchname)
-		if branch not in branch.limb.repository_branches:
-		    rbranch = branch.remote_branch
-		    if rbranch and rbranch in rbranch.limb.repository_branches:
-			branch = rbranch
-
-		branch.set_by_limb['providers'] = arr
-		branch.set_by_limb['provider_flags'] = {}
-
-		flags = m.group(2).split()
-		for flag in flags:
-		    if flag not in branch.valid_dependent_flags:
-			sys.stderr.write('branch_dependencies: '
-			    'Invalid flag "%s" for dependent branch %s\n' %
-			    (flag, branch.name))
-			sys.exit(1)
-		branch.set_by_limb['flags'] = flags
-
-		dependent_branches.append(branch)
-		dependent_branch = branch
-
+		providers = []
+		dependencies.append((m.group(1), tuple(m.group(2).split()),
+				     providers))
 		expect_provider = True
 		continue
 
 	    raise GitError('Syntax error: %s, line: "%s"' %
 				(dep_ref, orig_line))
 
+	return dependencies
+
+
+    @cached_property
+    def dependent_branches(self):
+	'''
+	Find, read and parse the limb's branch_dependencies file.
+	Return the limb's dependent branches.  Also, put branch
+	flags, provider branches, and branch provider flags into
+	branch.set_by_limb.
+	'''
+
+	dep_filename = self.branch_dep_filename
+	for limb in (self,
+		     self.remote_limb,
+		     self.parent and self.parent.remote_limb):
+	    if not limb:
+		continue
+	    info_branch = limb.info_branch
+	    dep_ref = '%s:%s' % (info_branch.id, dep_filename)
+	    parse = lambda contents: self.parse_dependencies(contents, dep_ref)
+	    dependencies = metadata_cache().value('branch_dependencies',
+				info_branch.id, dep_filename, parse)
+	    if dependencies is not None:
+		break
+	else:
+	    dependencies = []
+
+	dependent_branches = []
+	for subname, flags, provider_list in dependencies:
+	    branchname = '%s/%s' % (self.name, subname)
+	    branch = Branch.get(branchname)
+	    if branch not in branch.limb.repository_branch_set:
+		rbranch = branch.remote_branch
+		if rbranch and rbranch in rbranch.limb.repository_branch_set:
+		    branch = rbranch
+
+	    for flag in flags:
+		if flag not in branch.valid_dependent_flags:
+		    sys.stderr.write('branch_dependencies: '
+			'Invalid flag "%s" for dependent branch %s\n' %
+			(flag, branch.name))
+		    sys.exit(1)
+
+	    providers = []
+	    provider_flags_dict = {}
+	    branch.set_by_limb['flags'] = list(flags)
+	    branch.set_by_limb['providers'] = providers
+	    branch.set_by_limb['provider_flags'] = provider_flags_dict
+	    dependent_branches.append(branch)
+
+	    for branchname, provider_flags in provider_list:
+		if branchname.startswith('/'):
+		    remote = remote_alias()
+		    if remote:
+			branchname = remote + branchname
+		    else:
+			branchname = branchname[1:]
+		else:
+		    branchname = '%s/%s' % (self.name, branchname)
+		provider = Branch.get(branchname)
+		if not provider.id:
+		    if provider.remote_branch and provider.remote_branch.id:
+			provider = provider.remote_branch
+
+		for flag in provider_flags:
+		    if flag not in provider.valid_provider_flags:
+			sys.stderr.write('branch_dependencies: '
+			    'Invalid flag "%s" for provider %s of '
+			    'dependent branch %s\n' %
+			    (flag, provider.name, branch.name))
+			sys.exit(1)
+		provider_flags_dict[provider] = list(provider_flags)
+		providers.append(provider)
+
 	if hasattr(self, 'upstream_branches'):
 	    for ub in self.upstream_branches:
 		ub.merge_limb = self
@@ -478,33 +517,29 @@ class Limb(object):
 	return self.branch_status_dict['unchanged']
 
 
-    def write_push_log_entry(self, file):
-	zero_id = '0' * 40
-	tokens = []
-	tokens.append('%s UTC\n' % time.asctime(time.gmtime()))
+    def write_push_log_entry(self):
+	'''
+	Record the push of the limb's branches in the limb's PushLog
+	'''
+	zero_id = Ref.zero_id
+	entries = []
 	self.repository_branches		# fully populate self.branches
 	for branch in sorted(self.branches, key=lambda x: x.subname):
-		tokens.append(branch.subname)
-		tokens.append(' ')
-		tokens.append(branch.id or zero_id)
-		if hasattr(branch, 'newbranch'):
-		    tokens.append(' ')
-		    tokens.append(branch.newbranch.id or zero_id)
-		tokens.append('\n')
+	    new_id = None
+	    if hasattr(branch, 'newbranch'):
+		new_id = branch.newbranch.id or zero_id
+	    entries.append((branch.subname, branch.id or zero_id, new_id))
 
-	tokens.append('\n')
-	file.write(''.join(tokens))
+	PushLog(self.name).append(time.time(), entries)
 
 
     def exists(self):
 	"""Returns True if self's name is that of a local or remote limb"""
 
-	for prefix in ('refs/heads', 'refs/remotes'):
-	    cmd = ['git', 'for-each-ref', '%s/%s/*' % (prefix, self.name)]
-	    if bool(call(cmd, error=None, stderr=None)):
-		return True
-
-	return False
+	if not self.name:
+	    return False
+	node = limb_tree().find(self.name)
+	return node is not None and node.has_branches
 
 
 class Ref(object):
@@ -531,11 +566,14 @@ class Ref(object):
 	    name = '../%s' % name
 
 	if not id and not new_id:
-	    cmd = ['git', 'rev-parse', name]
-	    try:
-		id = call(cmd, stderr=None).rstrip()
-	    except:
-		id = None
+	    if ref_table and ref_table.knows(name):
+		id = ref_table.resolve(name)
+	    else:
+		cmd = ['git', 'rev-parse', name]
+		try:
+		    id = call(cmd, stderr=None).rstrip()
+		except:
+		    id = None
 	elif id == self.zero_id:
 	    id = None
 
@@ -699,6 +737,9 @@ class Branch(Ref):
 		    old_commit.rebased_to_commit = commit
 		    break
 
+	if self.limb and hasattr(self.limb, 'match_patches'):
+	    self.match_patches(commits_with_change, old_commits)
+
 	for old_commit in old_commits:
 	    if not hasattr(old_commit, 'rebased_to_commit'):
 		commits_with_change.append((old_commit, 'deleted'))
@@ -706,6 +747,32 @@ class Branch(Ref):
 	return commits_with_change
 
 
+    def match_patches(self, commits_with_change, old_commits):
+	'''
+	Mark created commits whose patches match those of unmatched
+	old commits as rebased, as they were re-applied with new ChangeIDs.
+	'''
+
+	old_commits = [x for x in old_commits
+			if not hasattr(x, 'rebased_to_commit')]
+	created = [x for x, change in commits_with_change if change == 'created']
+	if not old_commits or not created:
+	    return
+
+	index = patch_id_index()
+	index.fill(created + old_commits)
+	old_dict = index.patch_id_dict(old_commits)
+
+	for i, (commit, change) in enumerate(commits_with_change):
+	    if change != 'created':
+		continue
+	    old_commit = old_dict.get(index.patch_ids[commit.id])
+	    if old_commit and not hasattr(old_commit, 'rebased_to_commit'):
+		commits_with_change[i] = (commit, 'rebased')
+		commit.from_commits = [old_commit]
+		old_commit.rebased_to_commit = commit
+
+
     @cached_property
     def remote_branch(self):
 	remote = remote_alias()
@@ -780,6 +847,14 @@ class Branch(Ref):
 	return not self.newbranch or self.id == self.newbranch.id
 
 
+    @property
+    def fast_forward(self):
+	'''
+	Return True if self.newbranch contains the branch
+	'''
+	return bool(self.id) and commit_contains(self.newbranch.id, self.id)
+
+
     def has_branch_merge_base(self):
         self.upstream_version
         return hasattr(self, 'local_upstream_version')
@@ -912,13 +987,11 @@ class Branch(Ref):
 	Return the major kernel version on which this branch is based
 	'''
 
-        ref = "%s:%s" % (self.id, 'MONTAVISTA/merge_base')
-        cmd = ['git', 'show', ref]
-        version = call(cmd, error=None, stderr=None)
+	version = metadata_cache().value('merge_base', self.id,
+				'MONTAVISTA/merge_base', first_line)
         if version:
-            version = re.sub('\n.*', '', version)
             cmd = ['git', 'rev-parse', version]
-            if bool(call(cmd, stderr=None)):
+	    if object_exists(version) or call(cmd, stderr=None):
                 self.local_upstream_version = version
                 return version
             
@@ -1074,19 +1147,46 @@ class Commit(object):
 	'''
 	if id in cls.commit_dict:
 	    return cls.commit_dict[id]
+	elif re_commit_id.match(id):
+	    return cls.get_many([id])[0]
 	else:
 	    return read_commit(id)
 
 
-    def parents(self):
-	parents = []
-	for line in self.header:
-	    if line.startswith('parent '):
-		id = line.rstrip().split()[1]
-		commit = Commit.get(id)
-		parents.append(commit)
+    @classmethod
+    def get_many(cls, ids):
+	'''
+	Return a list of the commits with the given (full) ids
+
+	All commits that haven't yet been instantiated are read by a
+	single "git log --no-walk --stdin".
+	'''
+	missing = [x for x in ids if x not in cls.commit_dict]
+	if missing:
+	    read_log(['--no-walk', '--stdin'], input='\n'.join(missing) + '\n')
+
+	commits = []
+	for id in ids:
+	    if id not in cls.commit_dict:
+		raise GitError('Commit %s not found' % id)
+	    commits.append(cls.commit_dict[id])
+
+	return commits
+
+
+    @cached_property
+    def parent_ids(self):
+	'''
+	Return the ids of the commit's parents, as listed in its header
+	'''
+	return [x.split()[1] for x in self.header if x.startswith('parent ')]
+
 
-	return parents
+    def parents(self):
+	'''
+	Return the commit's parents, reading any that aren't yet instantiated
+	'''
+	return Commit.get_many(self.parent_ids)
 
 
     def contains(self, commit_id):
@@ -1237,11 +1337,9 @@ class Commit(object):
     @cached_property
     def patch_id(self):
 	'''
-	Return the patch-id for this commit
+	Return the patch-id for this commit, or None if it has no diff
 	'''
-	id = self.id
-	cmd = 'git diff %s^..%s | git patch-id' % (id, id)
-	return call(cmd, shell=True).split(None, 1)[0]
+	return patch_id_index().patch_id(self)
 
 
     @cached_property
@@ -1319,6 +1417,221 @@ class Commit(object):
 	call(cmd, stdout=file)
 
 
+def json_encode(obj):
+    '''
+    Return the JSON representation of obj, which may be composed of
+    dictionaries, lists, tuples, strings, numbers, booleans and None
+    '''
+    if obj is None:
+	return 'null'
+    if obj is True:
+	return 'true'
+    if obj is False:
+	return 'false'
+    if isinstance(obj, (int, long)):
+	return str(obj)
+    if isinstance(obj, float):
+	return repr(obj)
+    if isinstance(obj, basestring):
+	chars = []
+	for c in obj:
+	    if c == '"' or c == '\\':
+		chars.append('\\' + c)
+	    elif c < ' ' or c >= '\x7f':
+		chars.append('\\u%04x' % ord(c))
+	    else:
+		chars.append(c)
+	return '"%s"' % ''.join(chars)
+    if isinstance(obj, dict):
+	items = ['%s: %s' % (json_encode(str(k)), json_encode(v))
+		 for k, v in obj.items()]
+	return '{%s}' % ', '.join(items)
+    return '[%s]' % ', '.join([json_encode(x) for x in obj])
+
+
+class Tracer(object):
+    '''
+    Records the subprocesses run by this library and by the commands
+
+    Each process is recorded with its arguments, the function that ran
+    it, its duration, the number of bytes read from it, when known,
+    and its exit status.  If a filename is given, each record is
+    appended to the file as a line of JSON.  A summary table, grouped
+    by calling function and git command, is written to stderr on exit.
+    '''
+
+    def __init__(self, filename=None):
+	self.file = None
+	if filename:
+	    self.file = open(filename, 'a')
+	self.groups = {}
+	self.count = 0
+	self.seconds = 0.0
+	atexit.register(self.summarize)
+
+
+    def record(self, args, start, bytes, status, caller, input=None):
+	seconds = time.time() - start
+	if isinstance(args, basestring):
+	    args = [args]
+	args = list(args)
+
+	if self.file:
+	    record = {
+		'pid': os.getpid(),
+		'caller': caller,
+		'argv': args,
+		'start': start,
+		'seconds': seconds,
+		'bytes': bytes,
+		'status': status,
+	    }
+	    if input is not None:
+		record['input'] = input
+	    self.file.write(json_encode(record) + '\n')
+	    self.file.flush()
+
+	command = args[0]
+	if command == 'git' and len(args) > 1:
+	    command = 'git %s' % args[1]
+	key = (caller, command)
+	if key not in self.groups:
+	    self.groups[key] = [0, 0.0, 0]
+	group = self.groups[key]
+	group[0] += 1
+	group[1] += seconds
+	group[2] += bytes or 0
+	self.count += 1
+	self.seconds += seconds
+
+
+    def summarize(self):
+	if not self.count:
+	    return
+	sys.stdout.flush()
+	write = sys.stderr.write
+	write('\nmvgit trace: %d processes, %.3f seconds\n' %
+	      (self.count, self.seconds))
+	write('%7s %9s %11s  %s\n' % ('count', 'seconds', 'bytes',
+				     'caller: command'))
+	groups = [(x[1][1], x[0], x[1]) for x in self.groups.items()]
+	groups.sort()
+	groups.reverse()
+	for total, (caller, command), (count, seconds, bytes) in groups:
+	    write('%7d %9.3f %11d  %s: %s\n' %
+		  (count, seconds, bytes, caller, command))
+
+
+tracer = None
+
+def enable_tracing(filename=None):
+    '''
+    Start tracing subprocesses, writing JSON lines to filename, if given
+    '''
+    global tracer
+
+    if not tracer:
+	tracer = Tracer(filename)
+
+
+def trace_from_environment():
+    '''
+    Enable tracing if requested by the MVGIT_TRACE environment variable
+
+    Its value is the name of a file for the JSON records, or "1" to
+    output only the summary.
+    '''
+    value = os.environ.get('MVGIT_TRACE')
+    if not value:
+	return
+    if value in ('1', 'true', 'yes'):
+	value = None
+    enable_tracing(value)
+
+
+# Functions whose callers, rather than themselves, are of interest
+trace_plumbing = ('call', 'read_log', 'read_commit_range', 'read_commits',
+		  'read_commit', 'segments', 'loaded_ancestor', 'get_many',
+		  'get', 'read_object', 'read', 'check_objects', 'batch_check')
+
+def caller_name(depth=1):
+    '''
+    Return "file:function" of the caller, skipping this library's plumbing
+    '''
+    frame = sys._getframe(depth + 1)
+    while (frame.f_back and frame.f_globals is globals() and
+	   frame.f_code.co_name in trace_plumbing):
+	frame = frame.f_back
+
+    name = frame.f_code.co_name
+    if 'self' in frame.f_locals:
+	name = '%s.%s' % (frame.f_locals['self'].__class__.__name__, name)
+    return '%s:%s' % (os.path.basename(frame.f_code.co_filename), name)
+
+
+class Popen(subprocess.Popen):
+    '''
+    subprocess.Popen, recording each process for tracing when it is
+    waited for
+
+    Callers that read the process's output may set trace_bytes to the
+    number of bytes read, before waiting for the process.
+    '''
+
+    communicating = False
+
+    def __init__(self, args, *posargs, **kwargs):
+	self.trace_args = args
+	self.trace_start = time.time()
+	self.trace_bytes = None
+	self.trace_caller = None
+	self.traced = False
+	if tracer:
+	    self.trace_caller = caller_name(1)
+	subprocess.Popen.__init__(self, args, *posargs, **kwargs)
+
+
+    def wait(self):
+	status = subprocess.Popen.wait(self)
+	if tracer and not self.traced and not self.communicating:
+	    self.traced = True
+	    tracer.record(self.trace_args, self.trace_start,
+			  self.trace_bytes, status, self.trace_caller)
+	return status
+
+
+    def communicate(self, input=None):
+	self.communicating = True
+	try:
+	    stdout, stderr = subprocess.Popen.communicate(self, input)
+	finally:
+	    self.communicating = False
+	if stdout is not None and self.trace_bytes is None:
+	    self.trace_bytes = len(stdout)
+	self.wait()
+	return stdout, stderr
+
+
+class ByteCounter(object):
+    '''
+    Iterates over the lines of a file, counting the bytes read
+    '''
+
+    def __init__(self, file):
+	self.lines = iter(file)
+	self.bytes = 0
+
+
+    def __iter__(self):
+	return self
+
+
+    def next(self):
+	line = self.lines.next()
+	self.bytes += len(line)
+	return line
+
+
 def call(cmd, **kwargs):
     '''
     Call the given Linux command.
@@ -1364,13 +1677,14 @@ def call(cmd, **kwargs):
 	sys.stdout.write('-> ' + ' '.join(cmd) + '\n')
 	sys.stdout.flush()
 
-    p = subprocess.Popen(cmd, **kwargs)
+    p = Popen(cmd, **kwargs)
 
     if dev_null:
 	dev_null.close()
 
     if kwargs['stdout'] == subprocess.PIPE:
 	output = p.stdout.read()
+	p.trace_bytes = len(output)
     else:
 	output = ''
 
@@ -1384,9 +1698,11 @@ def call(cmd, **kwargs):
     return output
 
 
-def read_commits(tip, ancestor_id, with_filenames=False):
+def read_log(args, with_filenames=False, input=None):
     '''
-    Instantiate commits for a given range
+    Instantiate the commits output by "git log --pretty=raw <args>"
+
+    If input is given, it is written to git's stdin, for use with --stdin.
     '''
 
     re_whitespace = re.compile(r'^\s*$')
@@ -1462,162 +1778,1396 @@ def read_commits(tip, ancestor_id, with_filenames=False):
 
 	return commit, next_id
 
-    try:
-	if not tip.id:
-	    return []
-	tip = tip.id
-    except:
-	# use the tip string as is
-	pass
-
-    ancestor_stop = '^%s' % ancestor_id
-
-    cmd = ['git', 'log', '--pretty=raw', '--topo-order', '--reverse']
+    cmd = ['git', 'log', '--pretty=raw']
     if with_filenames:
 	cmd.append('--name-only')
-    cmd += [tip, ancestor_stop]
-#    print ' '.join(cmd)
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    cmd += args
+    if input is None:
+	p = Popen(cmd, stdout=subprocess.PIPE)
+    else:
+	p = Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+	p.stdin.write(input)
+	p.stdin.close()
+
+    file = p.stdout
+    if tracer:
+	file = ByteCounter(file)
 
     commits = []
-    commit, next_id = read_commit(p.stdout, None, with_filenames=with_filenames)
+    commit, next_id = read_commit(file, None, with_filenames=with_filenames)
     while next_id:
-	commit, next_id = read_commit(p.stdout, next_id, with_filenames)
+	commit, next_id = read_commit(file, next_id, with_filenames)
 	commits.append(commit)
 
+    if tracer:
+	p.trace_bytes = file.bytes
     if p.wait() != 0:
-#	print cmd
 	raise GitError('failed: %s' % ' '.join(cmd))
 
     p.stdout.close()
     return commits
 
 
-def read_commit(id):
-    return read_commits(id, '%s^' % id)[0]
-
-
-def notice(msg):
+def read_commit_range(tip, excludes, with_filenames=False):
     '''
-    Output a message on stdout
+    Instantiate the commits reachable from tip, but not from any of excludes
     '''
 
-    sys.stdout.write(msg)
+    args = ['--topo-order', '--reverse', tip] + ['^%s' % x for x in excludes]
+    return read_log(args, with_filenames)
 
 
-def current_branch():
+class RangeCache(object):
     '''
-    Return an object for the current branch
+    Remembers the commits of each range read by read_commits()
+
+    A range is identified by the commit ids of its tip and its base and
+    is stored as a tuple of segments, each segment being a list of
+    commits in topological order.  When a range can be composed from
+    a range that has already been read, only the missing commits are
+    read, and the segments of the existing range are shared with the
+    new range.
     '''
-    cmd = ['git', 'rev-parse', '--symbolic-full-name', 'HEAD']
-    fullname = call(cmd, error=None, stderr=None).rstrip()
-    prefix = Branch.prefix
-    if not fullname or not fullname.startswith(prefix):
-	raise GitError("No current branch.\n")
 
-    branchname = fullname[len(prefix):]
-    return Branch.get(branchname)
+    def __init__(self):
+	self.ranges = {}	# (tip, base) -> (segments, with_filenames)
+	self.bases = {}		# tip -> bases of the cached ranges from tip
+	self.tips = {}		# base -> tips of the cached ranges to base
 
 
-def current_limb():
-    '''
-    Return an object for the current limb
-    '''
-    cb = current_branch()
-    limb = cb.limb
-    if not limb:
-	raise GitError('Current branch "%s" is not part of a limb.\n' % cb.name)
+    def add(self, tip, base, segments, with_filenames):
+	segments = tuple([x for x in segments if x])
+	key = (tip, base)
+	if key not in self.ranges:
+	    self.bases.setdefault(tip, []).append(base)
+	    self.tips.setdefault(base, {})[tip] = True
+	self.ranges[key] = (segments, with_filenames)
+	return segments
 
-    return limb
 
+    def cached(self, tip, base, with_filenames=False):
+	'''
+	Return the segments of a range that has been read, or None
+	'''
+	entry = self.ranges.get((tip, base))
+	if entry and (entry[1] or not with_filenames):
+	    return entry[0]
+	return None
 
-def changeid_diff(left, right, symmetric=False, with_rejects=False):
-    """Return a list of commits in left but not in right, per ChangeIDs
 
-    If symmetric == True, then also return the list of commits that
-    are in right, but not in left.
-    """
+    def segments(self, tip, base, with_filenames=False):
+	'''
+	Return the segments of the commits reachable from tip, but not base
+	'''
+	if tip == base:
+	    return ()
 
-    left_changes_with_commits = left.changeids_with_commits
-    right_changes_with_commits = right.changeids_with_commits
-    left_dict = left.changeid_to_commit
-    right_dict = right.changeid_to_commit
+	segments = self.cached(tip, base, with_filenames)
+	if segments is not None:
+	    return segments
 
-    if not with_rejects:
-	for id in right.rejected_changes:
-	    right_dict[id] = None
+	# A range from tip to a base, b, between base and tip only
+	# lacks the commits from b to base.
+	for b in self.bases.get(tip, []):
+	    upper = self.cached(tip, b, with_filenames)
+	    if upper is None or not self.has_parent(upper, b):
+		continue
+	    if not commit_contains(b, base):
+		continue
+	    lower = self.segments(b, base, with_filenames)
+	    return self.add(tip, base, lower + upper, with_filenames)
 
-    left_ids = [x[0] for x in left_changes_with_commits]
-    left_commits = [left_dict[x] for x in left_ids if x not in right_dict]
+	# A range to base from an ancestor, t, of tip only lacks the
+	# commits from tip to t.
+	t = self.loaded_ancestor(tip, base, with_filenames)
+	if t:
+	    lower = self.cached(t, base, with_filenames)
+	    upper = read_commit_range(tip, [t, base], with_filenames)
+	    return self.add(tip, base, lower + (upper,), with_filenames)
 
-    # Delete any commits that are empty, as they won't propagate.  These are
-    # going to generally be empty merge commits, anyway.
-    i = 0
-    end = len(left_commits)
-    while (i < end):
-        if is_empty_commit(left_commits[i]):
-            del(left_commits[i])
-            end -= 1
-        else:
-            i += 1
+	commits = read_commit_range(tip, [base], with_filenames)
+	return self.add(tip, base, (commits,), with_filenames)
 
-    if not symmetric:
-	return left_commits
 
-    if not with_rejects:
-	for id in left.rejected_changes:
-	    left_dict[id] = None
+    def has_parent(self, segments, id):
+	'''
+	Return True if id is a parent of a commit in segments
 
-    right_ids = [x[0] for x in right_changes_with_commits]
-    right_commits = [right_dict[x] for x in right_ids if x not in left_dict]
+	For the segments of a range ending at id, this is true exactly
+	when id is an ancestor of the range's tip.
+	'''
+	for segment in segments:
+	    for commit in segment:
+		if id in commit.parent_ids:
+		    return True
+	return False
 
-    # Delete any commits that are empty, as they won't propagate.  These are
-    # going to generally be empty merge commits, anyway.
-    i = 0
-    end = len(right_commits)
-    while (i < end):
-        if is_empty_commit(right_commits[i]):
-            del(right_commits[i])
-            end -= 1
-        else:
-            i += 1
 
-    return (left_commits, right_commits)
+    def loaded_ancestor(self, tip, base, with_filenames):
+	'''
+	Return the nearest ancestor of tip that starts a cached range to base
 
+	Only the parents of already instantiated commits are followed,
+	so this never runs git.  None is returned if no such ancestor
+	is found.
+	'''
+	tips = self.tips.get(base)
+	if not tips:
+	    return None
 
-def branchnames(limbname="", recursive=False, branches=True, limbs=False):
-    '''Return the the branch names of all branches with the given limbname'''
+	seen = {tip: True, base: True}
+	queue = [tip]
+	i = 0
+	while i < len(queue):
+	    id = queue[i]
+	    i += 1
+	    if id in tips and id != tip:
+		if self.cached(id, base, with_filenames) is not None:
+		    return id
+
+	    commit = Commit.commit_dict.get(id)
+	    if not commit:
+		continue
+	    for parent_id in commit.parent_ids:
+		if parent_id not in seen:
+		    seen[parent_id] = True
+		    queue.append(parent_id)
 
-    prefix = limbname
-    if prefix and not prefix.endswith('/'):
-	prefix += '/'
+	return None
 
-    seen_limbs = {}
-    names = []
-    cmd = ['git', 'rev-parse', '--symbolic', '--branches', '--remotes']
-    for name in call(cmd).splitlines():
-	if prefix and not name.startswith(prefix):
-	    continue
-	if limbs:
-	    sublimbname = os.path.dirname(name)
-	    if not sublimbname in seen_limbs:
-		seen_limbs[sublimbname] = 1
-		if sublimbname != limbname:
-		    if recursive or sublimbname.find('/', len(prefix)) < 0:
-			names.append(sublimbname + '/')
-	if not branches:
-	    continue
-	if not recursive and name.find('/', len(prefix)) >= 0:
-	    continue
-	names.append(name)
 
-    return names
+range_cache = RangeCache()
+resolved_commit_ids = {}
+re_id_expression = re.compile(r'[0-9a-f]{40}[~^]')
 
+def commit_id(name):
+    '''
+    Return the full id of the commit named by name, or None if there is none
 
-def subnames(limbname, names=None, recursive=False, branches=True, limbs=False):
-    if not names:
-	names = branchnames(limbname, recursive=recursive,
-			    branches=branches, limbs=limbs)
+    What a name that starts with a full id resolves to never changes, so
+    it is remembered.  Other names are only remembered along with the
+    state of the ref table, when there is one, as refs may move.
+    '''
+    if not name:
+	return None
+    if re_commit_id.match(name):
+	return name
+
+    if re_id_expression.match(name):
+	key = name
+    elif ref_table:
+	key = (name, ref_table.output)
+    else:
+	key = None
+
+    if key is None or key not in resolved_commit_ids:
+	cmd = ['git', 'rev-parse', '--verify', '--quiet', '%s^{commit}' % name]
+	id = call(cmd, error=None, stderr=None).strip() or None
+	if key is None:
+	    return id
+	resolved_commit_ids[key] = id
+
+    return resolved_commit_ids[key]
+
+
+def read_commits(tip, ancestor_id, with_filenames=False):
+    '''
+    Instantiate commits for a given range
+
+    The range is looked up in, or composed from the ranges in, range_cache
+    so that commits are only read from git once.
+    '''
+
+    try:
+	if not tip.id:
+	    return []
+	tip = tip.id
+    except:
+	# use the tip string as is
+	pass
+
+    tip_id = commit_id(tip)
+    base_id = commit_id(ancestor_id)
+    if not tip_id or not base_id:
+	return read_commit_range(tip, [ancestor_id], with_filenames)
+
+    commits = []
+    for segment in range_cache.segments(tip_id, base_id, with_filenames):
+	commits += segment
+    return commits
+
+
+def read_commit(id):
+    return read_log(['--no-walk', id])[0]
+
+
+class CatFile(object):
+    '''
+    Reads git objects through a single "git cat-file --batch" process
+
+    Each object is requested by writing its name to the process's stdin,
+    and its contents are read back from the process's stdout, instead
+    of running "git show <object>" once for each object.  Objects that
+    are only looked up, without their contents, are checked through a
+    single "git cat-file --batch-check" process the same way.
+    '''
+
+    check_chunk = 256		# names written to --batch-check at once
+
+    def __init__(self):
+	self.process = None
+	self.check_process = None
+
+
+    def read_object(self, name):
+	'''
+	Return a (id, type, contents) tuple for the named object
+
+	None is returned if the object does not exist.
+	'''
+
+	if not self.process:
+	    cmd = ['git', 'cat-file', '--batch']
+	    self.process = Popen(cmd, stdin=subprocess.PIPE,
+				 stdout=subprocess.PIPE)
+	    self.process.traced = True	# each request is traced instead
+
+	p = self.process
+	start = time.time()
+	p.stdin.write('%s\n' % name)
+	p.stdin.flush()
+
+	header = p.stdout.readline()
+	if not header:
+	    self.close()
+	    raise GitError('failed: git cat-file --batch')
+
+	fields = header.split()
+	if len(fields) != 3:		# "<name> missing" or "<name> ambiguous"
+	    if tracer:
+		tracer.record(p.trace_args, start, len(header), 1,
+			      caller_name(), input=name)
+	    return None
+
+	id, type, size = fields
+	contents = p.stdout.read(int(size))
+	p.stdout.read(1)		# the newline following the contents
+	if tracer:
+	    tracer.record(p.trace_args, start, len(header) + len(contents) + 1,
+			  0, caller_name(), input=name)
+	return id, type, contents
+
+
+    def read(self, name):
+	'''
+	Return the contents of the named object, or None if it doesn't exist
+	'''
+
+	obj = self.read_object(name)
+	if not obj:
+	    return None
+	return obj[2]
+
+
+    def check_objects(self, names):
+	'''
+	Return an (id, type) tuple for each of the named objects, or None
+	for each one that doesn't exist
+
+	The names are written in chunks, each read back before the next
+	is written, so that neither pipe fills while the other is waited on.
+	'''
+
+	if not self.check_process:
+	    cmd = ['git', 'cat-file', '--batch-check']
+	    self.check_process = Popen(cmd, stdin=subprocess.PIPE,
+				       stdout=subprocess.PIPE)
+	    self.check_process.traced = True	# each request is traced
+
+	p = self.check_process
+	objects = []
+	for i in range(0, len(names), self.check_chunk):
+	    chunk = names[i:i + self.check_chunk]
+	    start = time.time()
+	    p.stdin.write(''.join(['%s\n' % x for x in chunk]))
+	    p.stdin.flush()
+
+	    bytes = 0
+	    for name in chunk:
+		line = p.stdout.readline()
+		if not line:
+		    self.close()
+		    raise GitError('failed: git cat-file --batch-check')
+		bytes += len(line)
+		fields = line.split()
+		if fields[-1] in ('missing', 'ambiguous'):
+		    objects.append(None)
+		else:
+		    objects.append((fields[0], fields[1]))
+	    if tracer:
+		tracer.record(p.trace_args, start, bytes, 0, caller_name(),
+			      input='\n'.join(chunk))
+	return objects
+
+
+    def close(self):
+	for process in (self.process, self.check_process):
+	    if process:
+		process.stdin.close()
+		process.stdout.close()
+		process.wait()
+	self.process = None
+	self.check_process = None
+
+
+cached_cat_file = None
+
+def cat_file():
+    '''
+    Return the CatFile object shared by all users of this library
+    '''
+    global cached_cat_file
+
+    if not cached_cat_file:
+	cached_cat_file = CatFile()
+    return cached_cat_file
+
+
+def batch_check(names):
+    '''
+    Return an (id, type) tuple for each of the named objects, or None for
+    each one that doesn't exist, through the shared CatFile
+    '''
+    return cat_file().check_objects(names)
+
+
+cached_git_dir = None
+
+def git_dir():
+    '''
+    Return the absolute path of the repository's git directory
+    '''
+    global cached_git_dir
+
+    if not cached_git_dir:
+	cmd = ['git', 'rev-parse', '--git-dir']
+	cached_git_dir = os.path.abspath(call(cmd).rstrip('\n'))
+    return cached_git_dir
+
+
+cache_format = 1
+
+def cache_filename(name):
+    return os.path.join(git_dir(), 'mvgit', name)
+
+
+def load_cache(name, default=None):
+    '''
+    Return the object saved in the named persistent cache
+
+    The default is returned if the cache doesn't exist, or can't be read,
+    or was written in a different format.
+    '''
+    try:
+	file = open(cache_filename(name), 'rb')
+	try:
+	    format, obj = pickle.load(file)
+	finally:
+	    file.close()
+    except:
+	return default
+
+    if format != cache_format:
+	return default
+    return obj
+
+
+def save_cache(name, obj):
+    '''
+    Save obj in the named persistent cache, replacing it atomically
+
+    Caches are only an optimization, so failures are silently ignored.
+    '''
+    filename = cache_filename(name)
+    dirname = os.path.dirname(filename)
+    try:
+	if not os.path.isdir(dirname):
+	    os.makedirs(dirname)
+	fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.%s.' % name)
+	file = os.fdopen(fd, 'wb')
+	try:
+	    pickle.dump((cache_format, obj), file, pickle.HIGHEST_PROTOCOL)
+	finally:
+	    file.close()
+	os.chmod(tmpname, 0666 & ~current_umask())
+	os.rename(tmpname, filename)
+    except:
+	try:
+	    os.unlink(tmpname)
+	except:
+	    pass
+
+
+def cache_mtime(name):
+    '''
+    Return the modification time of the named persistent cache, or None
+    '''
+    try:
+	return os.stat(cache_filename(name)).st_mtime
+    except OSError:
+	return None
+
+
+def current_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+class PersistentCache(object):
+    '''
+    Base class of the caches kept in $GIT_DIR/mvgit between commands
+
+    The cached object is loaded into self.data when the cache is
+    instantiated.  Subclasses call modified() after changing it, and
+    the cache is then saved when the program exits.
+    '''
+
+    cache_name = None
+
+    def __init__(self):
+	self.mtime = cache_mtime(self.cache_name)
+	self.data = load_cache(self.cache_name)
+	if self.data is None:
+	    self.data = self.empty()
+	self.dirty = False
+
+
+    def empty(self):
+	'''
+	Return the object held by a newly created cache
+	'''
+	return {}
+
+
+    def modified(self):
+	if not self.dirty:
+	    self.dirty = True
+	    atexit.register(self.save)
+
+
+    def save(self):
+	if self.dirty:
+	    save_cache(self.cache_name, self.data)
+	    self.mtime = cache_mtime(self.cache_name)
+	    self.dirty = False
+
+
+    def stale(self):
+	'''
+	Return True if another process saved the cache after it was loaded
+	'''
+	return cache_mtime(self.cache_name) != self.mtime
+
+
+class PatchIdIndex(PersistentCache):
+    '''
+    A persistent mapping of commit ids to patch ids
+
+    Patch ids identify a commit's change by its content, so they
+    match commits that were re-applied under a different ChangeID.
+    Commits without a diff, such as merges, map to None.
+    '''
+
+    cache_name = 'patch-ids'
+
+    def __init__(self):
+	PersistentCache.__init__(self)
+	self.patch_ids = self.data
+
+
+    def fill(self, commits):
+	'''
+	Compute and remember the patch ids of the commits not yet indexed
+
+	The patches of all such commits are produced by a single
+	"git log -p", whose output is fed to a single "git patch-id".
+	'''
+	ids = [x.id for x in commits if x.id not in self.patch_ids]
+	if not ids:
+	    return
+
+	log_cmd = ['git', 'log', '--no-walk', '--stdin', '-p', '--no-color',
+		    '--no-ext-diff', '--no-textconv']
+	patch_id_cmd = ['git', 'patch-id', '--stable']
+	log = Popen(log_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+	p = Popen(patch_id_cmd, stdin=log.stdout, stdout=subprocess.PIPE)
+	log.stdout.close()
+	log.stdin.write('\n'.join(ids) + '\n')
+	log.stdin.close()
+
+	found = {}
+	bytes = 0
+	for line in p.stdout:
+	    bytes += len(line)
+	    patch_id, id = line.split()
+	    found[id] = patch_id
+	p.stdout.close()
+	p.trace_bytes = bytes
+
+	if log.wait() != 0 or p.wait() != 0:
+	    raise GitError('failed: %s | %s' %
+			   (' '.join(log_cmd), ' '.join(patch_id_cmd)))
+
+	for id in ids:
+	    self.patch_ids[id] = found.get(id)
+	self.modified()
+
+
+    def patch_id(self, commit):
+	'''
+	Return the patch id of commit, or None if it has no diff
+	'''
+	self.fill([commit])
+	return self.patch_ids[commit.id]
+
+
+    def patch_id_dict(self, commits):
+	'''
+	Return a dictionary mapping the patch ids of commits to the commits
+	'''
+	self.fill(commits)
+	dict = {}
+	for commit in commits:
+	    patch_id = self.patch_ids[commit.id]
+	    if patch_id and patch_id not in dict:
+		dict[patch_id] = commit
+	return dict
+
+
+cached_patch_id_index = None
+
+def patch_id_index():
+    '''
+    Return the PatchIdIndex shared by all users of this library
+    '''
+    global cached_patch_id_index
+
+    if not cached_patch_id_index:
+	cached_patch_id_index = PatchIdIndex()
+    return cached_patch_id_index
+
+
+class MetadataCache(PersistentCache):
+    '''
+    A persistent cache of the metadata files read from commits
+
+    The id of the blob holding a file is remembered by commit id, and
+    the value parsed from the file is remembered by blob id, so files
+    such as MONTAVISTA/upstream_version are only read and parsed again
+    when a commit changes their contents.
+    '''
+
+    cache_name = 'metadata'
+
+    def __init__(self):
+	PersistentCache.__init__(self)
+	self.blob_ids = self.data['blob_ids']
+	self.values = self.data['values']
+	self.contents = {}
+
+
+    def empty(self):
+	return {'blob_ids': {}, 'values': {}}
+
+
+    def blob_id(self, commit_id, path):
+	'''
+	Return the id of the blob at path in the commit, or None
+	'''
+	key = (commit_id, path)
+	if key not in self.blob_ids:
+	    obj = cat_file().read_object('%s:%s' % key)
+	    if obj and obj[1] == 'blob':
+		self.blob_ids[key] = obj[0]
+		self.contents[obj[0]] = obj[2]
+	    else:
+		self.blob_ids[key] = None
+	    self.modified()
+	return self.blob_ids[key]
+
+
+    def value(self, kind, commit_id, path, parse):
+	'''
+	Return the value parsed from the file at path in the commit
+
+	The file's contents are passed to parse, and the result is
+	cached under kind and the blob's id.  None is returned if the
+	commit doesn't contain the file.
+	'''
+	if not commit_id:
+	    return None
+	blob_id = self.blob_id(commit_id, path)
+	if not blob_id:
+	    return None
+
+	key = (kind, blob_id)
+	if key not in self.values:
+	    contents = self.contents.pop(blob_id, None)
+	    if contents is None:
+		contents = cat_file().read(blob_id)
+	    self.values[key] = parse(contents)
+	    self.modified()
+	return self.values[key]
+
+
+cached_metadata_cache = None
+
+def metadata_cache():
+    '''
+    Return the MetadataCache shared by all users of this library
+    '''
+    global cached_metadata_cache
+
+    if not cached_metadata_cache:
+	cached_metadata_cache = MetadataCache()
+    return cached_metadata_cache
+
+
+def first_line(contents):
+    '''
+    Return the first line of a metadata file, without surrounding whitespace
+    '''
+    return re.sub('\n.*', '', contents.strip())
+
+
+existing_objects = {}
+
+def object_exists(name):
+    '''
+    Return True if name is a valid object name, as for "git rev-parse name"
+    '''
+    if name not in existing_objects:
+	obj = cat_file().check_objects([name])[0]
+	existing_objects[name] = obj is not None
+    return existing_objects[name]
+
+
+class ChangeIndex(PersistentCache):
+    '''
+    A persistent index of the changes carried by the limb branches
+
+    Each indexed commit is mapped to its changeid and bugz, each limb
+    branch to its tip, its merge base and the commits between them,
+    and each changeid to the branches carrying it, with the commit on
+    each branch.  The index is brought up to date by update(), which
+    does nothing unless a ref has changed, relists only the branches
+    that moved, and reads only the commits not already indexed.  The
+    commits of other ranges are indexed the same way by range_commits().
+    '''
+
+    cache_name = 'change-index'
+    index_chunk = 2000		# commits read by each "git log"
+
+    def __init__(self):
+	PersistentCache.__init__(self)
+	self.commits = self.data['commits']		# id -> (changeid, bugz)
+	self.branches = self.data['branches']	# name -> (tip, base, ids)
+	self.locations = self.data['locations']	# changeid -> {name: id}
+	self.bugz = self.data['bugz']		# bugz -> {changeid: True}
+
+
+    def empty(self):
+	return {'refs': None, 'commits': {}, 'branches': {},
+		'locations': {}, 'bugz': {}}
+
+
+    def index_commits(self, ids):
+	'''
+	Index the commits with the given (full) ids that aren't yet indexed
+
+	Such commits are read by a "git log" for each index_chunk of
+	them, and those that weren't already instantiated are then
+	forgotten, so that indexing a long history doesn't keep every
+	commit in memory.
+	'''
+	missing = [x for x in ids if x not in self.commits]
+	if not missing:
+	    return
+
+	for i in range(0, len(missing), self.index_chunk):
+	    chunk = missing[i:i + self.index_chunk]
+	    loaded = set([x for x in chunk if x in Commit.commit_dict])
+	    for commit in Commit.get_many(chunk):
+		changeid = commit.changeid
+		bugz = commit.bugz
+		self.commits[commit.id] = (changeid, bugz)
+		if bugz:
+		    self.bugz.setdefault(bugz, {})[changeid] = True
+		if commit.id not in loaded:
+		    del Commit.commit_dict[commit.id]
+	self.modified()
+
+
+    def range_commits(self, args):
+	'''
+	Return the ids of the commits listed by "git rev-list <args>"
+
+	Only the ids are listed, and only the commits that aren't
+	yet indexed are read.
+	'''
+	ids = call(['git', 'rev-list'] + args).split()
+	self.index_commits(ids)
+	return ids
+
+
+    def set_branch(self, name, entry):
+	'''
+	Replace the indexed commits of the named branch
+	'''
+	old = self.branches.pop(name, None)
+	if old:
+	    for id in old[2]:
+		branches = self.locations.get(self.commits[id][0])
+		if branches and branches.get(name) == id:
+		    del branches[name]
+		    if not branches:
+			del self.locations[self.commits[id][0]]
+
+	if entry:
+	    self.branches[name] = entry
+	    for id in entry[2]:
+		self.locations.setdefault(self.commits[id][0], {})[name] = id
+	self.modified()
+
+
+    def update(self):
+	'''
+	Bring the index up to date with the repository's limb branches
+	'''
+	table = ref_table or RefTable()
+	if table.output == self.data['refs']:
+	    return
+
+	names = {}
+	entries = {}
+	for name in table.branchnames():
+	    branch = Branch.get(name, table.resolve(name))
+	    if not branch.limb or not branch.id:
+		continue
+	    if branch.subname == Limb.limb_info_branchname:
+		continue
+	    try:
+		base = commit_id(branch.merge_base)
+	    except GitError:
+		continue
+	    if not base or base == branch.id:
+		continue
+	    names[name] = True
+
+	    entry = self.branches.get(name)
+	    if entry and entry[0] == branch.id and entry[1] == base:
+		continue
+
+	    cmd = ['git', 'rev-list', '--topo-order', '--reverse',
+		   branch.id, '^%s' % base]
+	    entries[name] = (branch.id, base, tuple(call(cmd).split()))
+
+	ids = {}
+	for entry in entries.values():
+	    for id in entry[2]:
+		ids[id] = True
+	self.index_commits(ids.keys())
+	for name, entry in entries.items():
+	    self.set_branch(name, entry)
+
+	for name in self.branches.keys():
+	    if name not in names:
+		self.set_branch(name, None)
+
+	self.data['refs'] = table.output
+	self.modified()
+
+
+    def changeid(self, id):
+	'''
+	Return the changeid of the commit with the given (full) id
+	'''
+	self.index_commits([id])
+	return self.commits[id][0]
+
+
+    def branches_with_change(self, changeid):
+	'''
+	Return a dictionary mapping each branch carrying changeid to
+	the commit carrying it there
+	'''
+	return self.locations.get(changeid, {})
+
+
+    def changeids_with_bugz(self, bugz):
+	'''
+	Return the indexed changeids whose commits have the given bugz
+	'''
+	changeids = self.bugz.get(bugz, {}).keys()
+	changeids.sort()
+	return changeids
+
+
+    def commits_with_prefix(self, prefix):
+	'''
+	Return the ids of the indexed commits starting with prefix
+	'''
+	return [x for x in self.commits if x.startswith(prefix)]
+
+
+cached_change_index = None
+
+def change_index():
+    '''
+    Return the ChangeIndex shared by all users of this library
+    '''
+    global cached_change_index
+
+    if not cached_change_index:
+	cached_change_index = ChangeIndex()
+    return cached_change_index
+
+
+class PushLog(object):
+    '''
+    The history of the pushes to a limb, kept in limblogs/ in the git dir
+
+    <limb>.pushes holds a record of each push, appended as it happens: a
+    line with the time of the push, in seconds and as text, a
+    "<subname> <id>" line for each of the limb's branches that the push
+    left alone, a "<subname> <old id> <new id>" line for each that it
+    updated, and a blank line.
+
+    Two indexes of fixed-width entries are appended along with each
+    record, so they can be searched by bisection: <limb>.pushes.idx
+    holds the time and offset of each record, and <limb>.pushes.d/<subname>
+    the time, offset and old and new ids of each update of the branch.
+    '''
+
+    time_entry = '%010d %012d\n'
+    move_entry = '%010d %012d %s %s\n'
+    time_entry_size = len(time_entry % (0, 0))
+    move_entry_size = len(move_entry % (0, 0, Ref.zero_id, Ref.zero_id))
+
+    def __init__(self, limbname, dirname=None):
+	if not dirname:
+	    dirname = os.path.join(git_dir(), 'limblogs')
+	self.limbname = limbname
+	self.filename = os.path.join(dirname, '%s.pushes' % limbname)
+	self.index_filename = self.filename + '.idx'
+	self.moves_dirname = self.filename + '.d'
+
+
+    def exists(self):
+	return os.path.exists(self.filename)
+
+
+    def append(self, pushtime, branches):
+	'''
+	Record a push at pushtime, given the (subname, old id, new id) of
+	each of the limb's branches, with a new id of None for each branch
+	that the push didn't update
+	'''
+	if not os.path.isdir(self.moves_dirname):
+	    os.makedirs(self.moves_dirname)
+
+	file = open(self.filename, 'a')
+	try:
+	    fcntl.lockf(file, fcntl.LOCK_EX)	# against concurrent pushes
+
+	    # the indexes are searched by bisection, so keep them in order
+	    pushtime = max(int(pushtime), self.last_time())
+
+	    file.seek(0, 2)
+	    offset = file.tell()
+	    file.write(self.format_record(pushtime, branches))
+	    file.flush()
+	    self.index_record(pushtime, offset, branches)
+	finally:
+	    file.close()
+
+
+    def format_record(self, pushtime, branches):
+	lines = ['%d %s UTC\n' % (pushtime, time.asctime(time.gmtime(pushtime)))]
+	for subname, old, new in branches:
+	    if new is None:
+		lines.append('%s %s\n' % (subname, old))
+	    else:
+		lines.append('%s %s %s\n' % (subname, old, new))
+	lines.append('\n')
+	return ''.join(lines)
+
+
+    def index_record(self, pushtime, offset, branches):
+	file = open(self.index_filename, 'a')
+	file.write(self.time_entry % (pushtime, offset))
+	file.close()
+
+	for subname, old, new in branches:
+	    if new is None or new == old:
+		continue
+	    file = open(os.path.join(self.moves_dirname, subname), 'a')
+	    file.write(self.move_entry % (pushtime, offset, old, new))
+	    file.close()
+
+
+    def prepend(self, pushes):
+	'''
+	Put records of the (time, branches) of earlier pushes, as for
+	append(), ahead of the recorded pushes, and rebuild the indexes
+	'''
+	if not os.path.isdir(self.moves_dirname):
+	    os.makedirs(self.moves_dirname)
+
+	file = open(self.filename, 'a+')
+	try:
+	    fcntl.lockf(file, fcntl.LOCK_EX)
+
+	    file.seek(0)
+	    records = list(pushes)
+	    while True:
+		record = self.read_record(file)
+		if not record:
+		    break
+		records.append(record)
+
+	    file.seek(0)
+	    file.truncate()
+	    last_time = 0
+	    for pushtime, branches in records:
+		last_time = max(int(pushtime), last_time)
+		file.write(self.format_record(last_time, branches))
+	    file.flush()
+
+	    self.rebuild_indexes(file)
+	finally:
+	    file.close()
+
+
+    def reindex(self):
+	'''
+	Rebuild the indexes from the records, as after a failure between
+	writing a record and indexing it
+	'''
+	file = open(self.filename, 'a+')
+	try:
+	    fcntl.lockf(file, fcntl.LOCK_EX)
+	    self.rebuild_indexes(file)
+	finally:
+	    file.close()
+
+
+    def rebuild_indexes(self, file):
+	'''
+	Rebuild the indexes from the records in file, which is locked
+	'''
+	if os.path.exists(self.index_filename):
+	    os.remove(self.index_filename)
+	if os.path.isdir(self.moves_dirname):
+	    for name in os.listdir(self.moves_dirname):
+		os.remove(os.path.join(self.moves_dirname, name))
+	else:
+	    os.makedirs(self.moves_dirname)
+
+	file.seek(0)
+	while True:
+	    offset = file.tell()
+	    record = self.read_record(file)
+	    if not record:
+		break
+	    pushtime, branches = record
+	    self.index_record(pushtime, offset, branches)
+
+
+    def read_record(self, file):
+	'''
+	Return the (time, branches) of the record at file's position,
+	or None at the end of the file
+	'''
+	header = file.readline()
+	if not header:
+	    return None
+
+	branches = []
+	while True:
+	    line = file.readline()
+	    if not line.strip():
+		break
+	    words = line.split()
+	    if len(words) == 2:
+		words.append(None)
+	    branches.append(tuple(words))
+
+	return int(header.split()[0]), branches
+
+
+    def bisect(self, file, entry_size, pushtime):
+	'''
+	Return the number of entries of an index with a time not after
+	pushtime
+	'''
+	file.seek(0, 2)
+	low, high = 0, file.tell() // entry_size
+	while low < high:
+	    middle = (low + high) // 2
+	    file.seek(middle * entry_size)
+	    if int(file.read(10)) <= pushtime:
+		low = middle + 1
+	    else:
+		high = middle
+	return low
+
+
+    def first_time(self):
+	'''
+	Return the time of the earliest push, or None if there is none
+	'''
+	try:
+	    file = open(self.index_filename)
+	except IOError:
+	    return None
+	try:
+	    entry = file.read(self.time_entry_size)
+	finally:
+	    file.close()
+	if len(entry) < self.time_entry_size:
+	    return None
+	return int(entry[:10])
+
+
+    def last_time(self):
+	'''
+	Return the time of the latest push, or 0 if there is none
+	'''
+	try:
+	    file = open(self.index_filename)
+	except IOError:
+	    return 0
+	try:
+	    file.seek(0, 2)
+	    count = file.tell() // self.time_entry_size
+	    if not count:
+		return 0
+	    file.seek((count - 1) * self.time_entry_size)
+	    return int(file.read(10))
+	finally:
+	    file.close()
+
+
+    def state(self, pushtime=None):
+	'''
+	Return the time of the latest push at or before pushtime, and a
+	dict of the ids of the limb's branches after it, by subname
+
+	(None, {}) is returned if there was no push by pushtime.
+	'''
+	if pushtime is None:
+	    pushtime = self.last_time()
+
+	try:
+	    file = open(self.index_filename)
+	except IOError:
+	    return None, {}
+	try:
+	    count = self.bisect(file, self.time_entry_size, pushtime)
+	    if not count:
+		return None, {}
+	    file.seek((count - 1) * self.time_entry_size)
+	    offset = int(file.read(self.time_entry_size).split()[1])
+	finally:
+	    file.close()
+
+	file = open(self.filename)
+	try:
+	    file.seek(offset)
+	    pushtime, branches = self.read_record(file)
+	finally:
+	    file.close()
+
+	ids = {}
+	for subname, old, new in branches:
+	    if new is None:
+		new = old
+	    if new != Ref.zero_id:
+		ids[subname] = new
+	return pushtime, ids
+
+
+    def moves(self, subname, since=None, until=None):
+	'''
+	Return the (time, old id, new id) of each push that updated the
+	branch, only those from since to until if they are given
+	'''
+	try:
+	    file = open(os.path.join(self.moves_dirname, subname))
+	except IOError:
+	    return []
+	try:
+	    size = self.move_entry_size
+	    start = 0
+	    if since is not None:
+		start = self.bisect(file, size, since - 1)
+	    file.seek(0, 2)
+	    end = file.tell() // size
+	    if until is not None:
+		end = self.bisect(file, size, until)
+	    if start >= end:
+		return []
+	    file.seek(start * size)
+	    data = file.read((end - start) * size)
+	finally:
+	    file.close()
+
+	moves = []
+	for i in range(0, len(data), size):
+	    words = data[i:i + size].split()
+	    moves.append((int(words[0]), words[2], words[3]))
+	return moves
+
+
+def notice(msg):
+    '''
+    Output a message on stdout
+    '''
+
+    sys.stdout.write(msg)
+
+
+def current_branch():
+    '''
+    Return an object for the current branch
+    '''
+    cmd = ['git', 'rev-parse', '--symbolic-full-name', 'HEAD']
+    fullname = call(cmd, error=None, stderr=None).rstrip()
+    prefix = Branch.prefix
+    if not fullname or not fullname.startswith(prefix):
+	raise GitError("No current branch.\n")
+
+    branchname = fullname[len(prefix):]
+    return Branch.get(branchname)
+
+
+def current_limb():
+    '''
+    Return an object for the current limb
+    '''
+    cb = current_branch()
+    limb = cb.limb
+    if not limb:
+	raise GitError('Current branch "%s" is not part of a limb.\n' % cb.name)
+
+    return limb
+
+
+def patch_diff(commits, other_commits):
+    """Return the commits whose patches are not among those of other_commits
+
+    The patch ids of both lists of commits are computed together, in bulk,
+    through the patch-id index.
+    """
+
+    index = patch_id_index()
+    index.fill(commits + other_commits)
+    other_dict = index.patch_id_dict(other_commits)
+
+    return [x for x in commits
+		if not index.patch_ids[x.id] or
+		    index.patch_ids[x.id] not in other_dict]
+
+
+def changeid_diff(left, right, symmetric=False, with_rejects=False,
+		  match_patches=False):
+    """Return a list of commits in left but not in right, per ChangeIDs
+
+    If symmetric == True, then also return the list of commits that
+    are in right, but not in left.
+
+    If match_patches == True, commits are also considered to be in
+    both branches when their patch ids match, even if their ChangeIDs
+    differ.
+    """
+
+    left_changes_with_commits = left.changeids_with_commits
+    right_changes_with_commits = right.changeids_with_commits
+    left_dict = left.changeid_to_commit
+    right_dict = right.changeid_to_commit
+
+    if not with_rejects:
+	for id in right.rejected_changes:
+	    right_dict[id] = None
+
+    left_ids = [x[0] for x in left_changes_with_commits]
+    left_commits = [left_dict[x] for x in left_ids if x not in right_dict]
+
+    if match_patches:
+	left_commits = patch_diff(left_commits, right.commits)
+
+    # Delete any commits that are empty, as they won't propagate.  These are
+    # going to generally be empty merge commits, anyway.
+    i = 0
+    end = len(left_commits)
+    while (i < end):
+        if is_empty_commit(left_commits[i]):
+            del(left_commits[i])
+            end -= 1
+        else:
+            i += 1
+
+    if not symmetric:
+	return left_commits
+
+    if not with_rejects:
+	for id in left.rejected_changes:
+	    left_dict[id] = None
+
+    right_ids = [x[0] for x in right_changes_with_commits]
+    right_commits = [right_dict[x] for x in right_ids if x not in left_dict]
+
+    if match_patches:
+	right_commits = patch_diff(right_commits, left.commits)
+
+    # Delete any commits that are empty, as they won't propagate.  These are
+    # going to generally be empty merge commits, anyway.
+    i = 0
+    end = len(right_commits)
+    while (i < end):
+        if is_empty_commit(right_commits[i]):
+            del(right_commits[i])
+            end -= 1
+        else:
+            i += 1
+
+    return (left_commits, right_commits)
+
+
+class LimbTree(object):
+    '''
+    The names of the repository's branches, arranged by limb
+
+    Each limb in the tree holds its sublimbs and the names of the
+    branches directly in it, in the order of the branch names, so the
+    branches and sublimbs of a limb are listed without looking at the
+    names of the other branches.
+    '''
+
+    def __init__(self, names):
+	self.root = LimbTreeNode('')
+	for name in names:
+	    node = self.root
+	    for word in name.split('/')[:-1]:
+		node = node.sublimb(word)
+	    node.entries.append(name)
+	    node.has_branches = True
+
+
+    def find(self, limbname):
+	'''
+	Return the node of the named limb, or None if it has no branches
+	'''
+	node = self.root
+	for word in limbname.strip('/').split('/'):
+	    if word:
+		node = node.sublimbs.get(word)
+		if not node:
+		    return None
+	return node
+
+
+    def branchnames(self, limbname, recursive, branches, limbs):
+	names = []
+	node = self.find(limbname)
+	if node:
+	    node.list(names, recursive, branches, limbs, True)
+	return names
+
+
+class LimbTreeNode(object):
+    '''
+    A limb in a LimbTree
+
+    entries holds the names of the limb's branches and the nodes of its
+    sublimbs, in the order in which they were first seen.
+    '''
+
+    def __init__(self, name):
+	self.name = name
+	self.entries = []
+	self.sublimbs = {}
+	self.has_branches = False
+
+
+    def sublimb(self, word):
+	node = self.sublimbs.get(word)
+	if not node:
+	    if self.name:
+		node = LimbTreeNode('%s/%s' % (self.name, word))
+	    else:
+		node = LimbTreeNode(word)
+	    self.sublimbs[word] = node
+	    self.entries.append(node)
+	return node
+
+
+    def list(self, names, recursive, branches, limbs, top):
+	'''
+	Append to names the names of the limb's branches and sublimbs,
+	in the order of "git rev-parse --symbolic --branches --remotes"
+
+	Only the sublimbs that directly contain branches are listed,
+	each just before its first branch.
+	'''
+	listed = top
+	for entry in self.entries:
+	    if isinstance(entry, LimbTreeNode):
+		if recursive:
+		    entry.list(names, recursive, branches, limbs, False)
+		elif limbs and entry.has_branches:
+		    names.append(entry.name + '/')
+		continue
+	    if limbs and not listed:
+		names.append(self.name + '/')
+		listed = True
+	    if branches:
+		names.append(entry)
+
+
+cached_limb_tree = None
+
+def limb_tree():
+    '''
+    Return the LimbTree of the repository's local and remote branches
+    '''
+    global cached_limb_tree
+
+    if cached_limb_tree:
+	return cached_limb_tree
+
+    if ref_table:
+	names = ref_table.branchnames()
+    else:
+	cmd = ['git', 'rev-parse', '--symbolic', '--branches', '--remotes']
+	names = call(cmd).splitlines()
+
+    cached_limb_tree = LimbTree(names)
+    return cached_limb_tree
+
+
+def branchnames(limbname="", recursive=False, branches=True, limbs=False):
+    '''Return the the branch names of all branches with the given limbname'''
+
+    return limb_tree().branchnames(limbname, recursive, branches, limbs)
+
+
+def subnames(limbname, names=None, recursive=False, branches=True, limbs=False):
+    if not names:
+	names = branchnames(limbname, recursive=recursive,
+			    branches=branches, limbs=limbs)
 
     return [x[(len(limbname)+1):] for x in names]
 
@@ -1630,6 +3180,10 @@ def all_branch_ids():
     if cached_branch_ids:
 	return cached_branch_ids
 
+    if ref_table:
+	cached_branch_ids = ref_table.branch_ids()
+	return cached_branch_ids
+
     cmd = ['git', 'rev-parse', '--branches', '--remotes']
     cached_branch_ids = call(cmd).splitlines()
     return cached_branch_ids
@@ -1649,6 +3203,108 @@ def check_repository():
 	raise GitError("Not in a git repository.")
 
 
+class ConfigSnapshot(object):
+    '''
+    The git configuration, as read by a single "git config --list -z"
+
+    Values are read from the snapshot instead of running "git config"
+    once for each variable.  Changes are written with set(), which
+    discards the snapshot so that it is read again when next used.
+    '''
+
+    def __init__(self):
+	self.values = None
+
+
+    def key(self, name):
+	'''
+	Return name as listed by git: the section and variable names are
+	case-insensitive, while a subsection name is not
+	'''
+	fields = name.split('.')
+	fields[0] = fields[0].lower()
+	fields[-1] = fields[-1].lower()
+	return '.'.join(fields)
+
+
+    def load(self):
+	if self.values is not None:
+	    return
+
+	self.values = {}
+	self.keys = []
+	cmd = ['git', 'config', '--list', '-z']
+	for entry in call(cmd, error=None, stderr=None).split('\0'):
+	    if not entry:
+		continue
+	    fields = entry.split('\n', 1)
+	    if len(fields) == 1:
+		fields.append('')		# a boolean without a value
+	    key, value = fields
+	    if key not in self.values:
+		self.values[key] = []
+		self.keys.append(key)
+	    self.values[key].append(value)
+
+
+    def get_all(self, name):
+	'''
+	Return a list of the values of the named variable
+	'''
+	self.load()
+	return list(self.values.get(self.key(name), []))
+
+
+    def get(self, name, default=None):
+	'''
+	Return the last value of the named variable, like "git config name"
+	'''
+	values = self.get_all(name)
+	if not values:
+	    return default
+	return values[-1]
+
+
+    def items(self):
+	'''
+	Return a list of (name, value) tuples for all variables, in order
+	'''
+	self.load()
+	items = []
+	for key in self.keys:
+	    for value in self.values[key]:
+		items.append((key, value))
+	return items
+
+
+    def set(self, name, value, add=False):
+	'''
+	Set (or, with add=True, add) a value of the named variable
+	'''
+	cmd = ['git', 'config']
+	if add:
+	    cmd.append('--add')
+	call(cmd + [name, value], error=None, stderr=None)
+	self.invalidate()
+
+
+    def invalidate(self):
+	self.values = None
+
+
+cached_config = None
+
+def config():
+    '''
+    Return the ConfigSnapshot shared by all users of this library
+    '''
+    global cached_config
+
+    if not cached_config:
+	cached_config = ConfigSnapshot()
+    return cached_config
+
+
 cached_remote_alias = None
 
 def remote_alias():
@@ -1656,20 +3312,19 @@ def remote_alias():
     if cached_remote_alias:
 	return cached_remote_alias
 
-    cmd = ['git', 'config', '--get', 'mvista.remote-alias']
-    lines = call(cmd, error=None, stderr=None).splitlines()
-    if lines:
-	cached_remote_alias = lines[-1].rstrip()
+    alias = config().get('mvista.remote-alias')
+    if alias:
+	cached_remote_alias = alias.rstrip()
 	return cached_remote_alias
 
-    cmd = ['git', 'config', '--get-regexp', r'remote\..*\.url']
-    lines = call(cmd, error=None, stderr=None).splitlines()
-    mvlinux_lines = [x for x in lines if
-	x.endswith('/mvlinux.git') or x.endswith('/mvlinux')]
-    if len(lines) == 1:
-	line = lines[0]
-    elif len(mvlinux_lines) == 1:
-	line = mvlinux_lines[0]
+    re_remote_url = re.compile(r'remote\..*\.url$')
+    urls = [x for x in config().items() if re_remote_url.match(x[0])]
+    mvlinux_urls = [x for x in urls if
+	x[1].endswith('/mvlinux.git') or x[1].endswith('/mvlinux')]
+    if len(urls) == 1:
+	name = urls[0][0]
+    elif len(mvlinux_urls) == 1:
+	name = mvlinux_urls[0][0]
     else:
 	sys.stderr.write(
 	    '\nError: Cannot automatically determine the remote alias '
@@ -1678,13 +3333,126 @@ def remote_alias():
 	    '"git config --add mvista.remote-alias <alias>".\n')
 	sys.exit(1)
 
-    name = line.split()[0]
     loffset = len('remote.')
     roffset = len('.url')
     cached_remote_alias = name[loffset:-roffset]
     return cached_remote_alias
 
 
+re_bugfix_limbname = re.compile(r'(.*)/bugfixes/\d+[^/]*$')
+
+def fetch_limbs(repo, limbnames, branchnames=[]):
+    '''
+    Update the remote-tracking branches of the named limbs from repo
+
+    Instead of fetching and pruning all of repo's refs, only the
+    branches of each limb and of its sublimbs, the branches of the
+    parent limb of each bugfixes limb, and the named branches are
+    listed by a single "git ls-remote" and fetched with explicit
+    refspecs.  Remote-tracking branches of those whose branches are
+    gone from repo are deleted.  The limbs' upstream version tags are
+    also fetched if they are missing.
+
+    A name that turns out to be that of a branch stands for the
+    branch's limb.  If repo isn't the name of a remote, all of it is
+    fetched and pruned.
+    '''
+    if config().get('remote.%s.url' % repo) is None:
+	call(['git', 'fetch', repo], stdout=sys.stdout, verbose=True)
+	call(['git', 'remote', 'prune', repo], stdout=sys.stdout,
+	     verbose=True)
+	forget_refs()
+	return
+
+    heads = 'refs/heads/'
+    tracking = 'refs/remotes/%s/' % repo
+
+    def parent_limbnames(limbnames):
+	parentnames = []
+	for limbname in limbnames:
+	    m = re_bugfix_limbname.match(limbname)
+	    if m:
+		parentnames.append(m.group(1))
+	return parentnames
+
+    def list_remote(limbnames):
+	parentnames = parent_limbnames(limbnames)
+
+	def wanted(name):
+	    for limbname in limbnames:
+		if name.startswith(limbname + '/'):
+		    return True
+	    for parentname in parentnames:
+		if os.path.dirname(name) == parentname:
+		    return True
+	    return name in branchnames
+
+	patterns = ['%s%s/*' % (heads, x) for x in limbnames + parentnames]
+	patterns += [heads + x for x in limbnames + branchnames]
+	ids = {}
+	for line in call(['git', 'ls-remote', repo] + patterns).splitlines():
+	    id, refname = line.split('\t')
+	    name = refname[len(heads):]
+	    if refname.startswith(heads) and (wanted(name) or
+					      name in limbnames):
+		ids[name] = id
+	return ids, wanted
+
+    limbnames = [x.rstrip('/') for x in limbnames]
+    remote_ids, wanted = list_remote(limbnames)
+    if [x for x in limbnames if x in remote_ids]:
+	limbnames = [(x in remote_ids and os.path.dirname(x)) or x
+		     for x in limbnames]
+	remote_ids, wanted = list_remote(limbnames)
+
+    cmd = ['git', 'for-each-ref', '--format=%(objectname) %(refname)']
+    cmd += [tracking + x for x in
+	    limbnames + parent_limbnames(limbnames) + branchnames]
+    local_ids = {}
+    for line in call(cmd).splitlines():
+	id, refname = line.split(' ', 1)
+	name = refname[len(tracking):]
+	if wanted(name):
+	    local_ids[name] = id
+
+    gone = [x for x in local_ids if x not in remote_ids]
+    gone.sort()
+    if gone:
+	for name in gone:
+	    sys.stdout.write(' * [pruned] %s/%s\n' % (repo, name))
+	input = ''.join(['delete %s%s %s\n' % (tracking, x, local_ids[x])
+			 for x in gone])
+	p = Popen(['git', 'update-ref', '--stdin'], stdin=subprocess.PIPE)
+	p.communicate(input)
+	if p.returncode != 0:
+	    raise GitError('failed: "git update-ref --stdin"')
+
+    names = [x for x in remote_ids if local_ids.get(x) != remote_ids[x]]
+    names.sort()
+    if names:
+	cmd = ['git', 'fetch', repo]
+	cmd += ['+%s%s:%s%s' % (heads, x, tracking, x) for x in names]
+	call(cmd, stdout=sys.stdout, verbose=True)
+
+    tags = []
+    for name in remote_ids:
+	if os.path.basename(name) not in (Limb.limb_common_branchname,
+					  Limb.limb_info_branchname):
+	    continue
+	version = metadata_cache().value('upstream_version', remote_ids[name],
+				Limb.upstream_version_filename, first_line)
+	if not version:
+	    continue
+	tag = 'refs/tags/v%s' % version
+	if tag not in tags and not object_exists(tag):
+	    tags.append(tag)
+    if tags:
+	cmd = ['git', 'fetch', repo] + ['%s:%s' % (x, x) for x in tags]
+	call(cmd, stdout=sys.stdout, verbose=True, error=False)
+
+    forget_refs()
+
+
 cached_repo_type = None
 
 def repo_type():
@@ -1692,15 +3460,13 @@ def repo_type():
     if cached_repo_type:
 	return cached_repo_type
 
-    cmd = ['git', 'config', 'mvista.repo-type']
-    cached_repo_type = call(cmd, error=None, stderr=None).strip()
+    cached_repo_type = config().get('mvista.repo-type', '').strip()
     if cached_repo_type:
 	return cached_repo_type
 
     for case in (1, 2, 3):
 	if case == 1:
-	    cmd = ['git', 'config', 'remote.origin.url']
-	    remote_url = call(cmd, error=None, stderr=None).strip()
+	    remote_url = config().get('remote.origin.url', '').strip()
 	    if '/git/kernel/mvlinux.git' in remote_url:
 		cached_repo_type = 'mvl6-kernel'
 		break
@@ -1717,8 +3483,7 @@ def repo_type():
 	    cached_repo_type = 'non-mvl6-kernel'
 	    break
 
-    cmd = ['git', 'config', 'mvista.repo-type', cached_repo_type]
-    call(cmd, error=None, stderr=None).strip()
+    config().set('mvista.repo-type', cached_repo_type)
 
     return cached_repo_type
 
@@ -1735,3 +3500,493 @@ You may annotate an MVL6 repository as such by running:
 	git config mvista.repo-type mvl6-kernel
 """)
 	sys.exit(1)
+
+
+class RefTable(object):
+    '''
+    The repository's refs, as read by a single "git for-each-ref"
+
+    Long-running processes, such as the cache daemon, set ref_table to
+    an instance of this class.  Refs are then looked up in the table
+    instead of running "git rev-parse" for each of them, and reload()
+    reports whether any ref changed since the table was last read.
+    '''
+
+    ref_formats = ('refs/%s', 'refs/tags/%s', 'refs/heads/%s',
+		   'refs/remotes/%s', 'refs/remotes/%s/HEAD')
+    re_plain_name = re.compile(r'[\w./+-]+$')
+    re_hex = re.compile(r'[0-9a-fA-F]{4,40}$')
+
+    def __init__(self):
+	self.output = None
+	self.reload()
+
+
+    def reload(self):
+	'''
+	Read the refs again, and return True if they changed
+	'''
+	cmd = ['git', 'for-each-ref', '--format=%(objectname) %(refname)']
+	output = call(cmd)
+	if output == self.output:
+	    return False
+
+	self.output = output
+	self.ids = {}
+	self.refnames = []
+	for line in output.splitlines():
+	    id, refname = line.split(' ', 1)
+	    self.ids[refname] = id
+	    self.refnames.append(refname)
+	return True
+
+
+    def knows(self, name):
+	'''
+	Return True if name can only refer to a ref in the table
+
+	Revision expressions, abbreviated ids and names of files in the
+	git directory, such as HEAD, are left to "git rev-parse".
+	'''
+	if not self.re_plain_name.match(name) or self.re_hex.match(name):
+	    return False
+	return not os.path.exists(os.path.join(git_dir(), name))
+
+
+    def resolve(self, name):
+	'''
+	Return the id of the named ref, as "git rev-parse" would, or None
+	'''
+	for format in self.ref_formats:
+	    refname = format % name
+	    if refname in self.ids:
+		return self.ids[refname]
+	return None
+
+
+    def branch_refnames(self):
+	return [x for x in self.refnames if
+		x.startswith('refs/heads/') or x.startswith('refs/remotes/')]
+
+
+    def branchnames(self):
+	'''
+	Return the output of "git rev-parse --symbolic --branches --remotes"
+	'''
+	names = []
+	for refname in self.branch_refnames():
+	    if refname.startswith('refs/heads/'):
+		names.append(refname[len('refs/heads/'):])
+	    else:
+		names.append(refname[len('refs/remotes/'):])
+	return names
+
+
+    def branch_ids(self):
+	'''
+	Return the output of "git rev-parse --branches --remotes"
+	'''
+	return [self.ids[x] for x in self.branch_refnames()]
+
+
+ref_table = None
+
+
+def forget_refs():
+    '''
+    Discard everything cached by ref name, keeping what is cached by id
+
+    This is for processes that outlive changes to the repository's refs.
+    Ref and Limb objects are discarded along with the names they resolved.
+    '''
+    global cached_branch_ids
+    global cached_limb_tree
+
+    Ref.ref_dict.clear()
+    Limb.limb_dict.clear()
+    resolved_commit_ids.clear()
+    existing_objects.clear()
+    cached_branch_ids = None
+    cached_limb_tree = None
+
+
+def forget_config():
+    '''
+    Discard the configuration and the values derived from it
+    '''
+    global cached_remote_alias
+    global cached_repo_type
+
+    config().invalidate()
+    cached_remote_alias = None
+    cached_repo_type = None
+
+
+def forget_stale_caches():
+    '''
+    Discard persistent caches that other processes have since saved
+    '''
+    global cached_patch_id_index
+    global cached_metadata_cache
+    global cached_change_index
+
+    if cached_patch_id_index and cached_patch_id_index.stale():
+	cached_patch_id_index.save()
+	cached_patch_id_index = None
+    if cached_metadata_cache and cached_metadata_cache.stale():
+	cached_metadata_cache.save()
+	cached_metadata_cache = None
+    if cached_change_index and cached_change_index.stale():
+	cached_change_index.save()
+	cached_change_index = None
+
+
+def save_caches():
+    '''
+    Save the persistent caches that have been modified
+    '''
+    if cached_patch_id_index:
+	cached_patch_id_index.save()
+    if cached_metadata_cache:
+	cached_metadata_cache.save()
+    if cached_change_index:
+	cached_change_index.save()
+
+
+def daemon_socket_path():
+    '''
+    Return the path of the cache daemon's socket for this repository
+    '''
+    return cache_filename('daemon.sock')
+
+
+in_daemon = False
+
+def run_in_daemon():
+    '''
+    Run this command in the repository's cache daemon, if it is running
+
+    The command line, working directory and environment are sent to
+    the daemon, which runs the command with its caches already warm.
+    The command's output is relayed, and this function exits with the
+    command's exit status.  It returns, so that the command runs
+    directly, if there is no daemon, if the command is already running
+    in the daemon, or if MVGIT_NO_DAEMON is set in the environment.
+    '''
+
+    if in_daemon or os.environ.get('MVGIT_NO_DAEMON'):
+	return
+
+    try:
+	path = daemon_socket_path()
+    except GitError:
+	return
+    if not os.path.exists(path):
+	return
+
+    token = '%d.%s' % (os.getpid(), time.time())
+    request = pickle.dumps({
+	'script': os.path.abspath(sys.argv[0]),
+	'argv': sys.argv,
+	'cwd': os.getcwd(),
+	'env': dict(os.environ),
+    }, pickle.HIGHEST_PROTOCOL)
+
+    socks = []
+    try:
+	for header in ('run %s %d\n' % (token, len(request)),
+		       'stdout %s\n' % token,
+		       'stderr %s\n' % token):
+	    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	    sock.connect(path)
+	    sock.sendall(header)
+	    socks.append(sock)
+	socks[0].sendall(request)
+    except socket.error:
+	for sock in socks:
+	    sock.close()
+	return				# a stale socket, run directly
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    ctl, out, err = socks
+    fds = {out: sys.stdout.fileno(), err: sys.stderr.fileno()}
+    status = ''
+    while socks:
+	try:
+	    readable = select.select(socks, [], [])[0]
+	except select.error:
+	    continue
+	for sock in readable:
+	    data = sock.recv(65536)
+	    if not data:
+		socks.remove(sock)
+		sock.close()
+	    elif sock == ctl:
+		status += data
+	    else:
+		while data:
+		    data = data[os.write(fds[sock], data):]
+
+    try:
+	sys.exit(int(status.split()[1]))
+    except (IndexError, ValueError):
+	sys.stderr.write('mvgit cache daemon: command did not complete\n')
+	sys.exit(1)
+
+
+def command_path(name):
+    '''
+    Return the path of the mvgit command git-<name>, or None
+
+    Commands are looked up in the directory holding this library,
+    where they are installed, as built or as their .py or .sh sources.
+    '''
+    dir = os.path.dirname(os.path.abspath(__file__))
+    for filename in ('git-%s' % name, 'git-%s.py' % name, 'git-%s.sh' % name):
+	path = os.path.join(dir, filename)
+	if os.path.isfile(path):
+	    return path
+    return None
+
+
+def command_names():
+    '''
+    Return the sorted names of the available mvgit commands
+    '''
+    dir = os.path.dirname(os.path.abspath(__file__))
+    names = {}
+    for filename in os.listdir(dir):
+	if not filename.startswith('git-'):
+	    continue
+	name, ext = os.path.splitext(filename[len('git-'):])
+	if ext not in ('', '.py', '.sh') or name.endswith('~'):
+	    continue
+	path = os.path.join(dir, filename)
+	if os.path.isfile(path) and is_mvgit_command(path):
+	    names[name] = 1
+    names = names.keys()
+    names.sort()
+    return names
+
+
+def is_mvgit_command(path):
+    '''
+    Return True if path is a script of this suite, not some other git-*
+    '''
+    file = open(path)
+    try:
+	return 'mvgit' in file.read(65536)
+    finally:
+	file.close()
+
+
+def is_python_script(path):
+    file = open(path)
+    try:
+	return 'python' in file.readline()
+    finally:
+	file.close()
+
+
+def exit_status(code):
+    '''
+    Return the exit status corresponding to the code of a SystemExit
+    '''
+    if code is None:
+	return 0
+    if isinstance(code, int):
+	return code
+    sys.stderr.write('%s\n' % code)
+    return 1
+
+
+def run_command(name, args=[], keep_refs=False):
+    '''
+    Run the mvgit command git-<name> with args, returning its exit status
+
+    Commands written in Python are loaded only when run, and are run
+    in this process, so that they share the caches of this library
+    instead of starting a new interpreter and reading everything again.
+    Each command gets its own Ref and Limb objects, and the caller's
+    are restored when the command completes, unless keep_refs is True,
+    in which case the command uses the caller's objects and the caller
+    sees what the command computed with them.  Other commands are run
+    as subprocesses.
+    '''
+
+    path = command_path(name)
+    if not path:
+	raise GitError('unknown command: %s' % name)
+
+    argv = [os.path.join(os.path.dirname(path), 'git-%s' % name)] + list(args)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    if not is_python_script(path):
+	return Popen([path] + list(args)).wait()
+
+    ref_dict = Ref.ref_dict.copy()
+    limb_dict = Limb.limb_dict.copy()
+    saved_argv = sys.argv
+    if not keep_refs:
+	forget_refs()
+    try:
+	sys.argv = argv
+	try:
+	    execfile(path, {'__name__': '__main__', '__file__': path})
+	    status = 0
+	except SystemExit, e:
+	    status = exit_status(e.code)
+    finally:
+	sys.argv = saved_argv
+	sys.stdout.flush()
+	sys.stderr.flush()
+	forget_config()
+	if not keep_refs:
+	    forget_refs()
+	    Ref.ref_dict.update(ref_dict)
+	    Limb.limb_dict.update(limb_dict)
+
+    return status
+
+
+def command_output(name, args=[]):
+    '''
+    Run the mvgit command git-<name> as run_command() does, and return
+    a tuple of its exit status and its standard output
+    '''
+
+    sys.stdout.flush()
+    output_file = tempfile.TemporaryFile()
+    saved_fd = os.dup(1)
+    os.dup2(output_file.fileno(), 1)
+    try:
+	status = run_command(name, args)
+    finally:
+	sys.stdout.flush()
+	os.dup2(saved_fd, 1)
+	os.close(saved_fd)
+
+    output_file.seek(0)
+    output = output_file.read()
+    output_file.close()
+    return status, output
+
+
+trace_from_environment()
+
+
+profile_top = 40		# functions listed in each profile report table
+profiling = False
+
+def run_main(main, profile_config=None):
+    '''
+    Run a command's main function, profiling it if requested
+
+    Profiling is requested by a --profile or --profile=<file> argument
+    ahead of the command's own arguments, which is removed before main
+    parses them, by setting the MVGIT_PROFILE environment variable to 1
+    or to a file name, or, if profile_config names a git config
+    variable, by setting that variable the same way.  See profile_main()
+    for the output.
+    '''
+    global profiling
+
+    request = None
+    while len(sys.argv) > 1:
+	arg = sys.argv[1]
+	if arg == '--profile':
+	    request = '1'
+	elif arg.startswith('--profile='):
+	    request = arg[len('--profile='):]
+	else:
+	    break
+	del sys.argv[1]
+
+    if not request:
+	request = os.environ.get('MVGIT_PROFILE')
+    if not request and profile_config:
+	request = config().get(profile_config)
+
+    if profiling or not request or request in ('0', 'false', 'no'):
+	main()
+	return
+
+    filename = None
+    if request not in ('1', 'true', 'yes'):
+	filename = request
+
+    profiling = True
+    try:
+	profile_main(main, filename)
+    finally:
+	profiling = False
+
+
+def profile_main(main, filename=None):
+    '''
+    Run main under cProfile (or profile, before python 2.5)
+
+    The pstats data is written to filename, by default a file named
+    after the command in a new private directory in the temporary
+    directory, as a hook may run with a shared one, and a report of the
+    functions taking the most time to filename.txt.  The report
+    includes the peak memory use, as measured by tracemalloc where it
+    is available, and otherwise as the process's maximum resident size.
+    '''
+    try:
+	import cProfile as profile
+    except ImportError:
+	import profile
+
+    command = os.path.basename(sys.argv[0])
+    if not filename:
+	dirname = tempfile.mkdtemp(prefix='mvgit-profile.')
+	filename = os.path.join(dirname, '%s.%d.prof' % (command, os.getpid()))
+
+    try:
+	import tracemalloc
+	tracemalloc.start()
+    except ImportError:
+	tracemalloc = None
+
+    profiler = profile.Profile()
+    start = time.time()
+    try:
+	profiler.runcall(main)
+    finally:
+	seconds = time.time() - start
+	if tracemalloc:
+	    memory = '%d KB traced' % (tracemalloc.get_traced_memory()[1] / 1024)
+	    tracemalloc.stop()
+	else:
+	    import resource
+	    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	    memory = '%d KB maximum resident' % maxrss
+	write_profile(profiler, filename, ' '.join(sys.argv), seconds, memory)
+
+
+def write_profile(profiler, filename, command, seconds, memory):
+    import pstats
+
+    profiler.dump_stats(filename)
+
+    report_filename = filename + '.txt'
+    report = open(report_filename, 'w')
+    saved_stdout = sys.stdout
+    sys.stdout = report		# pstats can't print elsewhere before 2.5
+    try:
+	sys.stdout.write('command: %s\n' % command)
+	sys.stdout.write('elapsed: %.3f seconds\n' % seconds)
+	sys.stdout.write('peak memory: %s\n\n' % memory)
+	stats = pstats.Stats(filename)
+	stats.sort_stats('cumulative').print_stats(profile_top)
+	stats.sort_stats('time').print_stats(profile_top)
+    finally:
+	sys.stdout = saved_stdout
+	report.close()
+
+    sys.stderr.write('Profile written to %s, report to %s\n' %
+		     (filename, report_filename))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+'''
+Tests that a limb's push history is recorded, indexed and searched
+'''
+
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mvgitlib as git
+
+
+zero = git.Ref.zero_id
+a = 'a' * 40
+b = 'b' * 40
+c = 'c' * 40
+
+
+class PushLogTest(unittest.TestCase):
+
+    def setUp(self):
+	self.dirname = tempfile.mkdtemp()
+	self.log = git.PushLog('limb', self.dirname)
+
+
+    def tearDown(self):
+	shutil.rmtree(self.dirname)
+
+
+    def push_all(self):
+	self.log.append(100, [('dev', zero, a), ('msd', zero, b)])
+	self.log.append(200, [('dev', a, b), ('msd', b, None)])
+	self.log.append(300, [('dev', b, None), ('msd', b, c)])
+	self.log.append(400, [('dev', b, c), ('msd', c, zero)])
+
+
+    def test_state(self):
+	self.push_all()
+	self.assertEqual(self.log.state(),
+			 (400, {'dev': c}))
+	self.assertEqual(self.log.state(299),
+			 (200, {'dev': b, 'msd': b}))
+	self.assertEqual(self.log.state(300),
+			 (300, {'dev': b, 'msd': c}))
+
+
+    def test_state_before_first_push(self):
+	self.assertEqual(self.log.state(), (None, {}))
+	self.push_all()
+	self.assertEqual(self.log.state(99), (None, {}))
+
+
+    def test_same_second(self):
+	self.log.append(100, [('dev', zero, a)])
+	self.log.append(100, [('dev', a, b)])
+	self.log.append(100, [('dev', b, c)])
+	self.assertEqual(self.log.state(100), (100, {'dev': c}))
+	self.assertEqual(self.log.moves('dev', 100, 100),
+			 [(100, zero, a), (100, a, b), (100, b, c)])
+
+
+    def test_out_of_order(self):
+	self.log.append(200, [('dev', zero, a)])
+	self.log.append(100, [('dev', a, b)])
+	self.assertEqual(self.log.last_time(), 200)
+	self.assertEqual(self.log.state(199), (None, {}))
+	self.assertEqual(self.log.state(200), (200, {'dev': b}))
+	self.assertEqual(self.log.moves('dev'),
+			 [(200, zero, a), (200, a, b)])
+
+
+    def test_moves(self):
+	self.push_all()
+	self.assertEqual(self.log.moves('dev'),
+			 [(100, zero, a), (200, a, b), (400, b, c)])
+	self.assertEqual(self.log.moves('dev', since=200),
+			 [(200, a, b), (400, b, c)])
+	self.assertEqual(self.log.moves('dev', until=200),
+			 [(100, zero, a), (200, a, b)])
+	self.assertEqual(self.log.moves('dev', 101, 399), [(200, a, b)])
+	self.assertEqual(self.log.moves('dev', 201, 399), [])
+	self.assertEqual(self.log.moves('msd', since=300),
+			 [(300, b, c), (400, c, zero)])
+	self.assertEqual(self.log.moves('none'), [])
+
+
+    def test_reindex(self):
+	self.push_all()
+	state = self.log.state(300)
+	moves = self.log.moves('dev')
+
+	# as if a push failed between writing its record and indexing it
+	size = os.path.getsize(self.log.index_filename)
+	file = open(self.log.index_filename, 'r+')
+	file.truncate(size - self.log.time_entry_size)
+	file.close()
+	os.remove(os.path.join(self.log.moves_dirname, 'dev'))
+	self.assertEqual(self.log.last_time(), 300)
+
+	self.log.reindex()
+	self.assertEqual(self.log.last_time(), 400)
+	self.assertEqual(self.log.state(300), state)
+	self.assertEqual(self.log.moves('dev'), moves)
+
+
+    def test_prepend(self):
+	self.log.append(300, [('dev', zero, c)])
+	self.log.prepend([(100, [('dev', zero, a)]),
+			  (200, [('dev', a, b)])])
+	self.assertEqual(self.log.first_time(), 100)
+	self.assertEqual(self.log.state(250), (200, {'dev': b}))
+	self.assertEqual(self.log.state(), (300, {'dev': c}))
+	self.assertEqual(self.log.moves('dev'),
+			 [(100, zero, a), (200, a, b), (300, zero, c)])
+
+
+if __name__ == '__main__':
+    unittest.main()
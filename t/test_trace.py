@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+'''
+Tests that traced processes are reported with the functions that run them
+'''
+
+import sys
+import os
+import subprocess
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mvgitlib as git
+
+
+class RecordingTracer(object):
+    '''
+    Keeps the caller of each process recorded, instead of reporting it
+    '''
+
+    def __init__(self):
+	self.callers = []
+
+
+    def record(self, args, start, bytes, status, caller, input=None):
+	self.callers.append(caller)
+
+
+class TraceCallerTest(unittest.TestCase):
+
+    def setUp(self):
+	self.saved_tracer = git.tracer
+	git.tracer = RecordingTracer()
+
+
+    def tearDown(self):
+	git.tracer = self.saved_tracer
+
+
+    def test_call(self):
+	git.call(['git', '--version'])
+	self.assertEqual(git.tracer.callers,
+			 ['test_trace.py:TraceCallerTest.test_call'])
+
+
+    def test_popen(self):
+	p = git.Popen(['git', '--version'], stdout=subprocess.PIPE)
+	p.communicate()
+	self.assertEqual(git.tracer.callers,
+			 ['test_trace.py:TraceCallerTest.test_popen'])
+
+
+if __name__ == '__main__':
+    unittest.main()